@@ -101,13 +101,15 @@ localizations = { #This dict contains all the texts in the bot in a JSON-like fo
             "not_found" : "User not found.",
             "selected" : "User selected:",
             "argument" : "Write the argument:",
-            "multiple_found" : "Multiple users found! Select the user's id."
+            "multiple_found" : "Multiple users found! Select the user's id.",
+            "search_results" : "No user has this name, similar users:"
         },
         "it" : {
             "not_found" : "Utente non trovato.",
             "selected" : "Utente selezionato:",
             "argument" : "Inserisci l'argomento:",
-            "multiple_found" : "Sono stati trovati più utenti! Seleziona l'id dell'utente."
+            "multiple_found" : "Sono stati trovati più utenti! Seleziona l'id dell'utente.",
+            "search_results" : "Nessun utente ha questo nome, utenti simili:"
         }
     },
     "set_lang" : {
@@ -168,12 +170,22 @@ localizations = { #This dict contains all the texts in the bot in a JSON-like fo
         "en" : {
             "msg_to_send" : "What do you want to send in broadcast?",
             "from" : "Announcement by",
-            "admin_from" : "Message to admin from"
+            "admin_from" : "Message to admin from",
+            "progress" : "Sending in progress:",
+            "completed" : "Sending completed:",
+            "sent" : "sent",
+            "blocked" : "blocked the bot",
+            "failed" : "failed"
         },
         "it" : {
             "msg_to_send" : "Che messaggio vuoi inviare in broadcast?",
             "from" : "Annuncio di",
-            "admin_from" : "Messaggio per gli admin di"
+            "admin_from" : "Messaggio per gli admin di",
+            "progress" : "Invio in corso:",
+            "completed" : "Invio completato:",
+            "sent" : "inviati",
+            "blocked" : "hanno bloccato il bot",
+            "failed" : "falliti"
         }
     },
     "send_to" : {
@@ -312,6 +324,10 @@ localizations = { #This dict contains all the texts in the bot in a JSON-like fo
             "list" : "Lista dei comandi personalizzati:"
         }
     },
+    "unavailable" : {
+        "en" : "This command isn't available at the moment.",
+        "it" : "Questo comando non è disponibile al momento."
+    },
     "cancel" : {
         "en" : "Command cancelled and markup cleared!",
         "it" : "Operazione annullata e markup rimosso!"
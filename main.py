@@ -1,62 +1,1413 @@
 #Copyright (C) 2025-2026  Giuseppe Caruso
-import telebot, os, logging, qrcode, wikipedia, random, faker, unidecode, asyncio, aiofiles
+import telebot, os, sys, logging, importlib, importlib.util, random, asyncio, aiofiles, aiohttp, json, time, hashlib, gzip, shutil, threading, bisect, multiprocessing
 from telebot.async_telebot import AsyncTeleBot
 from dotenv import load_dotenv
-from asynctinydb import TinyDB, Query
+from asynctinydb import TinyDB, Query, JSONStorage, CachingMiddleware, Document
 from telebot import types
-from datetime import date
-from deep_translator import GoogleTranslator
+from datetime import date, datetime, timedelta
+from collections import OrderedDict, deque, Counter
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, StringIO
+from copy import deepcopy
+from dataclasses import dataclass, field
+from abc import ABC, abstractmethod
 from localizations import *
 
+class Feature_Registry:
+    """Optional dependencies, imported only when the feature using them is first needed. Features whose modules aren't installed have their commands disabled"""
+    def __init__(self, features : dict[str, tuple[tuple[str], tuple[str]]]):
+        self.features = features #{feature : (modules, commands)}
+        self.modules = {} #{module name : module}, the modules imported so far
+        self.load_times = {} #{module name : seconds spent importing it}
+        self.availability = {} #{feature : bool}
+
+    def available(self, feature : str) -> bool:
+        """Returns True if every module of feature is installed, without importing them"""
+        if feature not in self.availability: self.availability[feature] = all(importlib.util.find_spec(module) is not None for module in self.features[feature][0])
+        return self.availability[feature]
+
+    def load(self, module : str):
+        """Imports module the first time it's requested and returns it"""
+        if module not in self.modules:
+            start = time.perf_counter()
+            self.modules[module] = importlib.import_module(module)
+            self.load_times[module] = time.perf_counter() - start
+        return self.modules[module]
+
+    def disabled_commands(self) -> set[str]:
+        """Returns the commands of the features that can't be loaded"""
+        return {command for feature, (modules, commands) in self.features.items() if not self.available(feature) for command in commands}
+
+    def import_report(self) -> str:
+        """Measures with python -X importtime the startup import of this module and the import of every optional module, returns a printable table"""
+        import subprocess
+        module_dir, module_name = os.path.split(os.path.abspath(__file__))
+        targets = [os.path.splitext(module_name)[0]] + [module for modules, commands in self.features.values() for module in modules]
+        lines = [f"{"module":<20}{"cumulative (ms)":>16}  feature"]
+        for target in targets:
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"], cwd=module_dir, capture_output=True, text=True)
+            times = [line.split("|") for line in result.stderr.splitlines() if line.startswith("import time:")]
+            cumulative = [int(fields[1]) for fields in times if len(fields) == 3 and fields[2].strip() == target and fields[1].strip().isdigit()]
+            feature = next((name for name, (modules, commands) in self.features.items() if target in modules), "startup")
+            lines.append(f"{target:<20}{f"{cumulative[-1] / 1000:.1f}" if cumulative else "not installed":>16}  {feature}")
+        return "\n".join(lines)
+
+features = Feature_Registry({ #{feature : (modules, commands)}
+    "qrcode" : (("qrcode",), ("qrcode",)),
+    "wikipedia" : (("wikipedia",), ("eventstoday",)),
+    "translator" : (("deep_translator",), ()), #Without it the events are sent in Italian
+    "randomname" : (("faker", "unidecode"), ("randomname",)),
+    "sqlite" : (("aiosqlite",), ()) #Needed only by the SQLite database backend
+})
+
+def write_atomically(path : str, data : str):
+    """Writes data to path through a temporary file, so the file is replaced only once fully written"""
+    with open(path + ".tmp", "w", encoding="utf-8") as tmp_file: tmp_file.write(data)
+    os.replace(path + ".tmp", path)
+
+class DB_Backend(ABC):
+    """Interface of the storages used by Bot_DB_Manager. Documents are dicts carrying a doc_id, conditions are TinyDB queries"""
+    async def open(self):
+        """Prepares the storage, called once before the bot starts handling updates"""
+
+    @abstractmethod
+    async def get(self, table : str, condition):
+        """Returns the first document matching condition, None if there isn't one"""
+
+    @abstractmethod
+    async def search(self, table : str, condition) -> list:
+        """Returns all the documents matching condition"""
+
+    async def get_by_key(self, table : str, field : str, value) -> list:
+        """Returns all the documents whose field equals value"""
+        return await self.search(table, Query()[field] == value)
+
+    @abstractmethod
+    async def upsert(self, table : str, data : dict, condition) -> list:
+        """Updates the documents matching condition with data, or inserts data as a new document. Returns the affected doc ids"""
+
+    @abstractmethod
+    async def remove(self, table : str, condition) -> list:
+        """Removes the documents matching condition, returns their doc ids"""
+
+    @abstractmethod
+    def iterate(self, table : str, fields : tuple[str, ...] = None):
+        """Async iterator over all the documents of a table, fields hints that only those fields will be read"""
+
+    @abstractmethod
+    async def insert_many(self, table : str, docs : list):
+        """Writes a batch of documents keeping their doc ids, replacing the ones already present, and commits it"""
+
+    async def count(self, table : str) -> int:
+        """Returns the number of documents in a table"""
+        return sum([1 async for _ in self.iterate(table)])
+
+    async def flush(self):
+        """Writes the pending changes, for storages that defer them"""
+
+    async def close(self):
+        """Writes the pending changes and releases the storage"""
+
+class TinyDB_Backend(DB_Backend):
+    """Stores the tables in a TinyDB JSON file, keeping hash indexes on the indexed fields in memory"""
+    def __init__(self, db_path : str, tables : tuple[str, ...], indexes : dict[str, tuple[str, ...]], write_behind : bool = False, flush_ops : int = 100):
+        self.write_behind = write_behind #when enabled writes are kept in memory and the file is rewritten every flush_ops writes or on flush
+        if self.write_behind: self.db = TinyDB(db_path, storage=CachingMiddleware(JSONStorage, flush_ops))
+        else: self.db = TinyDB(db_path)
+        self.tables = {table : self.db.table(table) for table in tables}
+
+        self.indexed_fields = {table : fields for table, fields in indexes.items() if table in self.tables} #{table : (field, ...)} fields with a hash index
+        self.indexes = {table : {field : {} for field in fields} for table, fields in self.indexed_fields.items()} #{table : {field : {value : {doc_id, ...}}}}
+        self.indexed_values = {table : {} for table in self.indexed_fields} #{table : {doc_id : {field : value}}} to move documents between buckets
+        self.indexes_ready = False
+
+    async def open(self):
+        """Builds the secondary indexes from the current content of the tables"""
+        for table, fields in self.indexed_fields.items():
+            self.indexes[table] = {field : {} for field in fields}
+            self.indexed_values[table] = {}
+            for doc in await self.tables[table].all():
+                self.index_doc(table, doc.doc_id, doc)
+        self.indexes_ready = True
+
+    def index_doc(self, table : str, doc_id, data : dict):
+        """Moves the document identified by doc_id to the index buckets of the indexed fields present in data"""
+        values = self.indexed_values[table].setdefault(doc_id, {})
+        for name in self.indexed_fields[table]:
+            if name not in data: continue
+            if name in values: self.discard_from_index(table, name, values[name], doc_id)
+            try: self.indexes[table][name].setdefault(data[name], set()).add(doc_id)
+            except TypeError: #unhashable values are not indexed
+                values.pop(name, None)
+                continue
+            values[name] = data[name]
+
+    def unindex_doc(self, table : str, doc_id):
+        """Removes the document identified by doc_id from the table indexes"""
+        for name, value in self.indexed_values[table].pop(doc_id, {}).items():
+            self.discard_from_index(table, name, value, doc_id)
+
+    def discard_from_index(self, table : str, field : str, value, doc_id):
+        """Removes doc_id from the bucket of value, dropping the bucket once empty"""
+        bucket = self.indexes[table][field].get(value)
+        if bucket is None: return
+        bucket.discard(doc_id)
+        if not bucket: del self.indexes[table][field][value]
+
+    async def get(self, table : str, condition):
+        return await self.tables[table].get(condition)
+
+    async def search(self, table : str, condition) -> list:
+        return await self.tables[table].search(condition)
+
+    async def get_by_key(self, table : str, field : str, value) -> list:
+        """Returns the documents whose field equals value, without scanning the table when the field is indexed"""
+        if field not in self.indexed_fields.get(table, ()): return await super().get_by_key(table, field, value)
+        if not self.indexes_ready: await self.open()
+        try: doc_ids = self.indexes[table][field].get(value)
+        except TypeError: return []
+        if not doc_ids: return []
+        return await self.tables[table].search(doc_ids=list(doc_ids))
+
+    async def upsert(self, table : str, data : dict, condition) -> list:
+        doc_ids = await self.tables[table].upsert(data, condition)
+        if self.indexes_ready and table in self.indexes:
+            for doc_id in doc_ids: self.index_doc(table, doc_id, data)
+        return doc_ids
+
+    async def remove(self, table : str, condition) -> list:
+        doc_ids = await self.tables[table].remove(condition)
+        if self.indexes_ready and table in self.indexes:
+            for doc_id in doc_ids: self.unindex_doc(table, doc_id)
+        return doc_ids
+
+    def iterate(self, table : str, fields : tuple[str, ...] = None):
+        return self.tables[table].__aiter__() #Already in memory, the whole documents are returned
+
+    async def insert_many(self, table : str, docs : list):
+        for doc in docs:
+            await self.tables[table].upsert(doc)
+            if self.indexes_ready and table in self.indexes: self.index_doc(table, doc.doc_id, doc)
+        await self.flush()
+
+    async def count(self, table : str) -> int:
+        return len(await self.tables[table].all())
+
+    async def flush(self):
+        if self.write_behind: await self.db.storage.flush()
+
+    async def close(self):
+        await self.db.close()
+
+class SQLite_Backend(DB_Backend):
+    """Stores each table in a SQLite table with a column per known field, so every write only touches the affected rows"""
+    #{table : {field : column type}}, JSON columns are (de)serialized, fields not listed here are kept in the extra JSON column
+    schema = {
+        "users" : {"user_id" : "INTEGER", "first_name" : "TEXT", "last_name" : "TEXT", "username" : "TEXT", "is_bot" : "BOOLEAN", "bot_name" : "TEXT", "chat_id" : "INTEGER",
+                   "commands" : "JSON", "admin_status" : "BOOLEAN", "exclusive_sentence" : "TEXT", "notifications" : "BOOLEAN", "localization" : "TEXT", "gender" : "TEXT", "event" : "JSON", "bot_name_version" : "INTEGER"},
+        "banned_words" : {"type" : "TEXT", "list" : "JSON"},
+        "custom_commands" : {"name" : "TEXT", "content" : "JSON"},
+        "meta" : {"type" : "TEXT"}
+    }
+
+    def __init__(self, db_path : str, tables : tuple[str, ...], indexes : dict[str, tuple[str, ...]], write_behind : bool = False, flush_ops : int = 100):
+        if not features.available("sqlite"): raise ImportError("The SQLite backend needs aiosqlite, install it or use a JSON database")
+        self.db_path = db_path
+        self.tables = tables
+        self.indexes = indexes
+        self.write_behind = write_behind #when enabled the transaction is committed every flush_ops writes or on flush
+        self.flush_ops = flush_ops
+        self.pending_ops = 0
+        self.conn = None
+        self.lock = asyncio.Lock() #upserts read and write back the rows, they mustn't interleave
+
+    async def connect(self):
+        """Returns the aiosqlite connection, opening it and creating the missing tables, columns and indexes on first use"""
+        if self.conn is None:
+            aiosqlite = features.load("aiosqlite")
+            self.conn = await aiosqlite.connect(self.db_path)
+            self.conn.row_factory = aiosqlite.Row
+            await self.conn.execute("PRAGMA journal_mode=WAL")
+            for table in self.tables:
+                columns = self.schema.get(table, {})
+                await self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (doc_id INTEGER PRIMARY KEY{"".join(f', "{column}" {kind}' for column, kind in columns.items())}, extra JSON)')
+                async with self.conn.execute(f'PRAGMA table_info("{table}")') as cursor: existing = {row["name"] async for row in cursor}
+                added = [column for column in columns if column not in existing]
+                for column in added: await self.conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {columns[column]}')
+                if added: await self.move_to_columns(table, added)
+                for name in self.indexes.get(table, ()):
+                    if name in columns: await self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{name}" ON "{table}" ("{name}")')
+            await self.conn.commit()
+        return self.conn
+
+    async def open(self):
+        await self.connect()
+
+    async def move_to_columns(self, table : str, columns : list[str]):
+        """Moves the values of fields added to the schema from the extra column of the existing rows to their new columns"""
+        kinds = self.schema[table]
+        async with self.conn.execute(f'SELECT doc_id, extra FROM "{table}" WHERE extra IS NOT NULL') as cursor: rows = await cursor.fetchall()
+        for row in rows:
+            extra = json.loads(row["extra"])
+            moved = {column : extra.pop(column) for column in columns if column in extra}
+            if not moved: continue
+            values = [json.dumps(value) if value is not None and kinds[column] == "JSON" else value for column, value in moved.items()]
+            await self.conn.execute(f'UPDATE "{table}" SET {", ".join(f'"{column}" = ?' for column in moved)}, extra = ? WHERE doc_id = ?', [*values, json.dumps(extra) if extra else None, row["doc_id"]])
+
+    def row_to_doc(self, table : str, row) -> Document:
+        """Converts a row to a document, restoring the JSON and boolean fields"""
+        doc = json.loads(row["extra"]) if row["extra"] else {}
+        for column, kind in self.schema.get(table, {}).items():
+            value = row[column]
+            if value is not None:
+                if kind == "JSON": value = json.loads(value)
+                elif kind == "BOOLEAN": value = bool(value)
+            doc[column] = value
+        return Document(doc, row["doc_id"])
+
+    def doc_to_row(self, table : str, doc : dict) -> dict:
+        """Converts a document to the values of the table columns, the unknown fields go in the extra column"""
+        columns = self.schema.get(table, {})
+        row = {column : None for column in columns}
+        extra = {}
+        for name, value in doc.items():
+            if name not in columns: extra[name] = value
+            elif value is not None and columns[name] == "JSON": row[name] = json.dumps(value)
+            else: row[name] = value
+        row["extra"] = json.dumps(extra) if extra else None
+        return row
+
+    def where(self, table : str, condition) -> tuple[str, list] | None:
+        """Translates a `field == value` query on a plain column to SQL, returns None when the query must be evaluated in Python"""
+        frame = getattr(condition, "_frame", None)
+        if not frame or len(frame) != 3 or frame[0] != "==" or len(frame[1]) != 1: return None
+        if self.schema.get(table, {}).get(frame[1][0]) not in ("INTEGER", "TEXT", "BOOLEAN"): return None
+        return f'"{frame[1][0]}" IS ?', [frame[2]]
+
+    async def select(self, table : str, condition, limit : int = None) -> list[Document]:
+        """Returns the documents matching condition, using the table indexes when the condition can be translated"""
+        where = self.where(table, condition)
+        if where is None:
+            docs = []
+            async for doc in self.iterate(table):
+                if condition(doc): docs.append(doc)
+                if limit and len(docs) >= limit: break
+            return docs
+
+        conn = await self.connect()
+        async with conn.execute(f'SELECT * FROM "{table}" WHERE {where[0]}{f" LIMIT {limit}" if limit else ""}', where[1]) as cursor:
+            return [self.row_to_doc(table, row) for row in await cursor.fetchall()]
+
+    async def get(self, table : str, condition):
+        docs = await self.select(table, condition, 1)
+        return docs[0] if docs else None
+
+    async def search(self, table : str, condition) -> list:
+        return await self.select(table, condition)
+
+    async def write_row(self, table : str, doc : dict, doc_id : int = None) -> int:
+        """Inserts a document, or replaces the one identified by doc_id, returns its doc id"""
+        row = self.doc_to_row(table, doc)
+        conn = await self.connect()
+        if doc_id is None:
+            cursor = await conn.execute(f'INSERT INTO "{table}" ({", ".join(f'"{column}"' for column in row)}) VALUES ({", ".join("?" * len(row))})', list(row.values()))
+            return cursor.lastrowid
+        await conn.execute(f'UPDATE "{table}" SET {", ".join(f'"{column}" = ?' for column in row)} WHERE doc_id = ?', [*row.values(), doc_id])
+        return doc_id
+
+    async def upsert(self, table : str, data : dict, condition) -> list:
+        async with self.lock:
+            docs = await self.select(table, condition)
+            if docs:
+                doc_ids = []
+                for doc in docs:
+                    doc.update(data)
+                    doc_ids.append(await self.write_row(table, doc, doc.doc_id))
+            else: doc_ids = [await self.write_row(table, data)]
+            await self.written()
+        return doc_ids
+
+    async def remove(self, table : str, condition) -> list:
+        async with self.lock:
+            doc_ids = [doc.doc_id for doc in await self.select(table, condition)]
+            conn = await self.connect()
+            await conn.executemany(f'DELETE FROM "{table}" WHERE doc_id = ?', [(doc_id,) for doc_id in doc_ids])
+            await self.written()
+        return doc_ids
+
+    async def iterate(self, table : str, fields : tuple[str, ...] = None):
+        conn = await self.connect()
+        schema = self.schema.get(table, {})
+        if fields and all(name in schema for name in fields): #Only the needed columns are read and decoded
+            async with conn.execute(f'SELECT {", ".join(f'"{name}"' for name in fields)} FROM "{table}"') as cursor:
+                async for row in cursor:
+                    doc = {}
+                    for name in fields:
+                        value = row[name]
+                        if value is not None:
+                            if schema[name] == "JSON": value = json.loads(value)
+                            elif schema[name] == "BOOLEAN": value = bool(value)
+                        doc[name] = value
+                    yield doc
+            return
+        async with conn.execute(f'SELECT * FROM "{table}"') as cursor:
+            async for row in cursor: yield self.row_to_doc(table, row)
+
+    async def insert_many(self, table : str, docs : list):
+        rows = [{"doc_id" : doc.doc_id, **self.doc_to_row(table, doc)} for doc in docs]
+        if not rows: return
+        conn = await self.connect()
+        async with self.lock:
+            await conn.executemany(f'INSERT OR REPLACE INTO "{table}" ({", ".join(f'"{column}"' for column in rows[0])}) VALUES ({", ".join("?" * len(rows[0]))})', [list(row.values()) for row in rows])
+            self.pending_ops += 1
+            await self.flush()
+
+    async def count(self, table : str) -> int:
+        conn = await self.connect()
+        async with conn.execute(f'SELECT COUNT(*) FROM "{table}"') as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def written(self):
+        """Commits the write, or defers it until flush_ops writes are pending in write-behind mode"""
+        self.pending_ops += 1
+        if not self.write_behind or self.pending_ops >= self.flush_ops: await self.flush()
+
+    async def flush(self):
+        if self.conn and self.pending_ops:
+            await self.conn.commit()
+            self.pending_ops = 0
+
+    async def close(self):
+        if self.conn:
+            await self.flush()
+            await self.conn.close()
+            self.conn = None
+
+class TinyDB_JSON_Reader:
+    """Streams the documents of a TinyDB JSON file table by table, keeping in memory only a chunk of the file and the document being parsed"""
+    def __init__(self, path : str, chunk_size : int = 1 << 16):
+        self.file = open(path, encoding="utf-8")
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+
+    def read_more(self) -> bool:
+        """Appends the next chunk of the file to the buffer, dropping the part already parsed. Returns False at the end of the file"""
+        chunk = self.file.read(self.chunk_size)
+        if not chunk: return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n": self.pos += 1
+            if self.pos < len(self.buffer): return self.buffer[self.pos]
+            if not self.read_more(): raise ValueError(f"Unexpected end of {self.file.name}")
+
+    def expect(self, char : str):
+        """Consumes the next non whitespace character, which must be char"""
+        if self.peek() != char: raise ValueError(f"Expected {char!r} at {self.file.tell()} in {self.file.name}, found {self.buffer[self.pos]!r}")
+        self.pos += 1
+
+    def value(self):
+        """Parses the JSON value starting at the current position, reading more of the file until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if not self.read_more(): raise
+
+    def members(self):
+        """Yields the keys of the object starting at the current position, the caller must consume each value before the next key"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == "}":
+                self.pos += 1
+                return
+            self.expect(",")
+
+    def __iter__(self):
+        """Yields (table, doc_id, document) in file order"""
+        for table in self.members():
+            for doc_id in self.members():
+                yield table, doc_id, self.value()
+
+    def close(self):
+        self.file.close()
+
 class Bot_DB_Manager:
     """Class to manage Database creation and read/write operations"""
-    def __init__(self, db_path : str, *tables : str):
+    backends = {"tinydb" : TinyDB_Backend, "sqlite" : SQLite_Backend} #Storages selectable by name or by the db_path scheme (i.e. sqlite:///BOT_DB.sqlite)
+
+    def __init__(self, db_path : str, *tables : str, backend : str | type = None, cache_size : int = 1024, cache_keys : dict[str, str] = {"users" : "user_id"},
+                 indexes : dict[str, tuple[str, ...]] = {"users" : ("user_id", "username", "first_name"), "banned_words" : ("type",), "custom_commands" : ("name",), "meta" : ("type",)},
+                 write_behind : bool = False, flush_interval : float = 5.0, flush_ops : int = 100):
         """Initialize the database with a path, a query and tables"""
-        self.db = TinyDB(db_path)
+        scheme, path = self.split_db_path(db_path)
+        if scheme:
+            db_path = path
+            if backend is None: backend = scheme
+        elif backend is None: backend = "sqlite" if db_path.lower().endswith((".db", ".sqlite", ".sqlite3")) else "tinydb"
+        if isinstance(backend, str): backend = self.backends[backend]
+
+        self.write_behind = write_behind #when enabled the backend defers its writes, flushed every flush_interval seconds, flush_ops writes and on close
+        self.flush_interval = flush_interval
+        self.flush_task = None
+        self.backend = backend(db_path, tables, indexes, write_behind, flush_ops)
         self.query = Query()
-        self.tables = {}
-        for table in tables:
-            self.tables[table] = self.db.table(table)
+        self.tables = tables
+
+        self.cache_size = cache_size #Max number of documents kept in memory for each cached table
+        self.cache_keys = {table : field for table, field in cache_keys.items() if table in self.tables} #{table : field} tables cached by the value of field
+        self.cache = {table : OrderedDict() for table in self.cache_keys} #{table : {key : (doc_id, document)}} in LRU order
+        self.cached_ids = {table : {} for table in self.cache_keys} #{table : {doc_id : key}} to write through updates made by condition
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    async def open(self):
+        """Prepares the backend and starts the periodic flush in write-behind mode"""
+        await self.backend.open()
+        if self.write_behind and self.flush_task is None: self.flush_task = asyncio.create_task(self.flush_periodically())
+
+    async def flush(self):
+        """Writes the pending changes, when write-behind is enabled"""
+        await self.backend.flush()
+
+    async def flush_periodically(self):
+        """Flushes the pending changes every flush_interval seconds"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def get_by_key(self, table : str, field : str, value) -> list:
+        """Returns the list of documents whose field equals value, without scanning the table when the field is indexed"""
+        return await self.backend.get_by_key(table, field, value)
     
     async def get_single_doc(self, table : str, condition, attribute: str = None):
         """Returns the first document found or one of its attributes. Useful when searching by a unique id"""
-        doc = await self.tables[table].get(condition)
+        doc = await self.backend.get(table, condition)
         if doc:
             if attribute: 
                 try: return doc[attribute]
                 except KeyError: return None
         return doc
 
+    async def get_cached_doc(self, table : str, key, attribute : str = None):
+        """Returns the document whose cache key field equals key, or one of its attributes, reading the database only on a cache miss"""
+        cache = self.cache[table]
+        if key in cache:
+            self.cache_hits += 1
+            cache.move_to_end(key)
+            doc = cache[key][1]
+        else:
+            self.cache_misses += 1
+            found = await self.get_by_key(table, self.cache_keys[table], key)
+            if not found: return None
+            doc = self.cache_doc(table, key, found[0])
+
+        if attribute: return deepcopy(doc.get(attribute))
+        return deepcopy(doc)
+
+    def cache_doc(self, table : str, key, doc) -> dict:
+        """Stores a copy of a document in the table cache, evicting the least recently used one when full"""
+        cache = self.cache[table]
+        cached = deepcopy(dict(doc))
+        cache[key] = (doc.doc_id, cached)
+        cache.move_to_end(key)
+        self.cached_ids[table][doc.doc_id] = key
+        while len(cache) > self.cache_size:
+            _, (old_id, _) = cache.popitem(last=False)
+            self.cached_ids[table].pop(old_id, None)
+        return cached
+
+    def uncache_doc(self, table : str, doc_id):
+        """Removes from the table cache the document identified by doc_id, if present"""
+        key = self.cached_ids[table].pop(doc_id, None)
+        if key is not None: self.cache[table].pop(key, None)
+
+    def cache_stats(self) -> dict:
+        """Returns the hit/miss counters and the current size of the documents cache"""
+        lookups = self.cache_hits + self.cache_misses
+        return {"hits" : self.cache_hits, "misses" : self.cache_misses, "hit_rate" : self.cache_hits / lookups if lookups else 0.0,
+                "size" : {table : len(cache) for table, cache in self.cache.items()}, "max_size" : self.cache_size}
+
     async def get_docs(self, table : str, condition) -> list:
         "Returns a list of all documents in  table matching a conditions"
-        docs = await self.tables[table].search(condition)
+        docs = await self.backend.search(table, condition)
         return docs
 
     async def contains(self, table : str, condition) -> bool:
         """Cheks if a table contains the document identified by a condition"""
-        return await self.tables[table].contains(condition)
-
-    async def upsert_values(self, table : str, data : dict, condition):
-        """Upserts a dict of values"""
-        await self.tables[table].upsert(data, condition)
+        return await self.backend.get(table, condition) is not None
+
+    def iterate(self, table : str, fields : tuple[str, ...] = None):
+        """Async iterator over all the documents of a table, with fields the backend may read only those fields"""
+        return self.backend.iterate(table, fields)
+
+    async def upsert_values(self, table : str, data : dict, condition, flush : bool = False):
+        """Upserts a dict of values, flush forces the write to disk in write-behind mode"""
+        doc_ids = await self.backend.upsert(table, data, condition)
+        if table in self.cache:
+            for doc_id in doc_ids: #Write through the cached copies, so reads never go stale
+                key = self.cached_ids[table].get(doc_id)
+                if key is None: continue
+                key_field = self.cache_keys[table]
+                if key_field in data and data[key_field] != key: self.uncache_doc(table, doc_id)
+                else: self.cache[table][key][1].update(deepcopy(data))
+        if flush: await self.flush()
     
-    async def remove_values(self, table : str, condition):
-        "Removes from a table values matching a condition"
-        await self.tables[table].remove(condition)
+    async def remove_values(self, table : str, condition, flush : bool = False):
+        "Removes from a table values matching a condition, flush forces the write to disk in write-behind mode"
+        doc_ids = await self.backend.remove(table, condition)
+        if table in self.cache:
+            for doc_id in doc_ids: self.uncache_doc(table, doc_id)
+        if flush: await self.flush()
     
     async def close(self):
-        await self.db.close()
+        """Stops the periodic flush and closes the database, writing any pending change"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.backend.close()
+
+    @staticmethod
+    def split_db_path(db_path : str) -> tuple[str, str]:
+        """Splits a db_path in its scheme and file path, like SQLAlchemy URLs sqlite:///rel.sqlite is relative and sqlite:////abs.sqlite absolute"""
+        scheme, separator, path = db_path.partition("://")
+        if not separator: return "", db_path
+        return scheme, path.removeprefix("/")
+
+    @classmethod
+    async def migrate(cls, source : str, destination : str, *tables : str, backend : str | type = None, batch_size : int = 500, chunk_size : int = 1 << 16, checkpoint_path : str = None) -> dict[str, tuple[int, int]]:
+        """Copies a TinyDB JSON database to the destination backend, streaming it table by table in batches of batch_size documents.
+        Progress is saved to a checkpoint file, so an interrupted migration resumes where it stopped. Returns {table : (source documents, destination documents)}"""
+        logger = logging.getLogger(__name__)
+        tables = tables or ("users", "banned_words", "custom_commands", "meta")
+        if checkpoint_path == None: checkpoint_path = f"{cls.split_db_path(destination)[1]}.migration"
+        copied = {} #{table : documents of the source already written to the destination}
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint: copied = json.load(checkpoint)
+            logger.info(f"Resuming migration from {checkpoint_path}: {copied}")
+
+        target = cls(destination, *tables, backend=backend, cache_keys={}, write_behind=True, flush_ops=batch_size) #each batch is committed by insert_many
+        await target.open()
+        reader = TinyDB_JSON_Reader(source, chunk_size)
+        counts = {table : 0 for table in tables} #{table : documents found in the source}
+        batch, batch_table = [], None
+        written, start = 0, time.monotonic()
+
+        async def write_batch():
+            nonlocal batch, written
+            await target.backend.insert_many(batch_table, batch)
+            copied[batch_table] = counts[batch_table]
+            write_atomically(checkpoint_path, json.dumps(copied))
+            written += len(batch)
+            logger.info(f"{batch_table}: {copied[batch_table]} documents copied, {written / max(time.monotonic() - start, 1e-9):.0f} documents/s")
+            batch = []
+
+        try:
+            for table, doc_id, doc in reader:
+                if table not in counts: continue
+                counts[table] += 1
+                if counts[table] <= copied.get(table, 0): continue #already copied before the interruption
+                if batch and batch_table != table: await write_batch()
+                batch_table = table
+                batch.append(Document(doc, int(doc_id)))
+                if len(batch) >= batch_size: await write_batch()
+            if batch: await write_batch()
+
+            result = {table : (counts[table], await target.backend.count(table)) for table in tables}
+        finally:
+            reader.close()
+            await target.close()
+
+        for table, (source_count, destination_count) in result.items():
+            if source_count != destination_count: logger.warning(f"{table}: {source_count} documents in the source, {destination_count} in the destination")
+        if all(source_count == destination_count for source_count, destination_count in result.values()) and os.path.exists(checkpoint_path): os.remove(checkpoint_path)
+        logger.info(f"Migration of {written} documents completed in {time.monotonic() - start:.1f}s: {result}")
+        return result
+
+class Banned_Words_Matcher:
+    """Banned words compiled once per list change: a set for the exact (or reversed) banned names and an Aho-Corasick automaton for the ultrabanned substrings"""
+    #Lookalike characters replaced before matching, each name is checked against every charset
+    charsets = [{'1' : 'i', '3' : 'e', '4' : 'r', '0' : 'o', '7' : 'l', '5' : 's', '$': 'e', '€':'e', 'т' : 't', 'п' : 'n', '\u03c5' : 'u', '\u0435' : 'e', 'ε' : 'e', '6' : 'g'},
+                {'1' : 'i', '3' : 'e', '4' : 'a', '0' : 'o', '7' : 'l', '5' : 's', '$': 'e', '€':'e', 'т' : 't', 'п' : 'n', '\u03c5' : 'u', '\u0435' : 'e', 'ε' : 'e', '6' : 'g'}]
+    translations = [str.maketrans({**charset, ' ' : None}) for charset in charsets]
+
+    def __init__(self, banned_words : list[str], ultra_banned_words : list[str]):
+        self.banned_words = set(banned_words)
+        self.goto = [{}] #goto[state] = {char : next state}
+        self.fail = [0]
+        self.output = [False] #True if an ultrabanned word (or its reverse) ends in the state
+        for word in set(ultra_banned_words) | {word[::-1] for word in ultra_banned_words}:
+            state = 0
+            for char in word:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] = True
+
+        queue = deque(self.goto[0].values()) #the fail links are built breadth first, the first level falls back to the root
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]: fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] or self.output[self.fail[next_state]]
+
+    def contains_ultra_banned(self, wordname : str) -> bool:
+        """Return true if an ultrabanned word, or its reverse, is a substring of wordname"""
+        if self.output[0]: return True
+        state = 0
+        for char in wordname:
+            while state and char not in self.goto[state]: state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]: return True
+        return False
+
+    def matches(self, name : str) -> bool:
+        """Return true if name is banned, false otherwise"""
+        for translation in self.translations:
+            wordname = name.translate(translation).lower()
+            if wordname in self.banned_words or wordname[::-1] in self.banned_words: return True
+            if self.contains_ultra_banned(wordname): return True
+        return False
+
+class Broadcast_Engine:
+    """Sends messages to many chats concurrently within Telegram's limits: a global token bucket, a minimum interval between requests to the same chat and retries honoring retry_after"""
+    transient_errors = (telebot.asyncio_helper.ApiHTTPException, telebot.asyncio_helper.RequestTimeout, aiohttp.ClientError, asyncio.TimeoutError)
+
+    def __init__(self, concurrency : int = 30, rate : float = 25, burst : int = 30, chat_interval : float = 1.0, max_retries : int = 3, backoff : float = 1.0, progress_interval : float = 5.0):
+        self.concurrency = concurrency #Max chats being sent to at the same time
+        self.rate = rate #Requests per second allowed to the whole bot, Telegram allows about 30
+        self.burst = burst
+        self.chat_interval = chat_interval #Seconds between two requests to the same chat
+        self.max_retries = max_retries
+        self.backoff = backoff #Seconds waited before retrying a transient error, doubled at each attempt
+        self.progress_interval = progress_interval #Seconds between two progress reports
+        self.tokens = burst
+        self.refilled = time.monotonic()
+        self.paused_until = 0 #Flood control (error 429) pauses every request, not only the failed one
+        self.chat_ready = {} #{chat_id : time of the next request allowed}
+        self.logger = logging.getLogger(__name__)
+
+    async def wait_turn(self, chat_id : int):
+        """Waits until the global rate, the chat rate and any flood wait allow a request to chat_id"""
+        while True:
+            now = time.monotonic()
+            wait = max(self.paused_until, self.chat_ready.get(chat_id, 0)) - now
+            if wait <= 0:
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+                self.refilled = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if len(self.chat_ready) > 10000: self.chat_ready = {chat : ready for chat, ready in self.chat_ready.items() if ready > now}
+                    self.chat_ready[chat_id] = now + self.chat_interval
+                    return
+                wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    async def request(self, chat_id : int, call : callable):
+        """Awaits call(), an API request to chat_id, within the limits. Flood waits and transient errors are retried with backoff"""
+        for attempt in range(self.max_retries + 1):
+            await self.wait_turn(chat_id)
+            try: return await call()
+            except telebot.asyncio_helper.ApiTelegramException as e:
+                if e.error_code == 429:
+                    delay = e.result_json.get("parameters", {}).get("retry_after", self.backoff)
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                elif e.error_code >= 500: delay = self.backoff * 2 ** attempt
+                else: raise
+                if attempt == self.max_retries: raise
+            except self.transient_errors:
+                if attempt == self.max_retries: raise
+                delay = self.backoff * 2 ** attempt
+            await asyncio.sleep(delay)
+
+    async def run(self, chat_ids : list[int], send : callable, progress : callable = None) -> dict[str, int]:
+        """Awaits send(chat_id) for every chat, with at most concurrency chats in flight. progress(done, counts) is awaited after each chat. Returns the count of each outcome"""
+        counts = {"sent" : 0, "blocked" : 0, "failed" : 0}
+        pending = iter(chat_ids)
+
+        async def worker():
+            for chat_id in pending:
+                try:
+                    await send(chat_id)
+                    counts["sent"] += 1
+                except telebot.asyncio_helper.ApiTelegramException as e:
+                    counts["blocked" if e.error_code == 403 else "failed"] += 1
+                except (telebot.asyncio_helper.ApiException, *self.transient_errors) as e:
+                    counts["failed"] += 1
+                    self.logger.warning(f"Sending to {chat_id} failed: {e}")
+                if progress: await progress(sum(counts.values()), counts)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(chat_ids)))))
+        return counts
+
+def render_qrcode(text : str, params : dict) -> bytes:
+    """Renders text as a QR code and returns the PNG bytes, executed in the bot's process pool"""
+    qrcode = features.load("qrcode")
+    code = qrcode.QRCode(error_correction=getattr(qrcode.constants, f"ERROR_CORRECT_{params["error_correction"]}"), box_size=params["box_size"], border=params["border"])
+    code.add_data(text)
+    buffer = BytesIO()
+    code.make_image().save(buffer, format="PNG")
+    return buffer.getvalue()
+
+class QR_Code_Cache:
+    """Content addressed cache of the QR codes: the Telegram file_id of codes already sent, and an LRU of rendered PNGs not uploaded yet"""
+    def __init__(self, max_file_ids : int = 4096, max_png_bytes : int = 8 * 1024 * 1024):
+        self.file_ids = OrderedDict() #{key : file_id}, a file_id can be sent again without uploading
+        self.pngs = OrderedDict() #{key : PNG bytes}, dropped once the code gets a file_id
+        self.max_file_ids = max_file_ids
+        self.max_png_bytes = max_png_bytes
+        self.png_bytes = 0
+        self.file_id_hits = 0
+        self.png_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text : str, params : dict) -> str:
+        """Returns the hash identifying the QR code of text rendered with params"""
+        return hashlib.sha256(json.dumps([text, params], sort_keys=True).encode()).hexdigest()
+
+    def get_file_id(self, key : str) -> str | None:
+        """Returns the file_id of the code identified by key, if it was already sent"""
+        file_id = self.file_ids.get(key)
+        if file_id is not None:
+            self.file_ids.move_to_end(key)
+            self.file_id_hits += 1
+        return file_id
+
+    def get_png(self, key : str) -> bytes | None:
+        """Returns the rendered PNG of the code identified by key, counting a miss if it must be rendered"""
+        png = self.pngs.get(key)
+        if png is not None:
+            self.pngs.move_to_end(key)
+            self.png_hits += 1
+        else: self.misses += 1
+        return png
+
+    def store_png(self, key : str, png : bytes):
+        """Caches a rendered PNG, evicting the least recently used ones over max_png_bytes"""
+        if len(png) > self.max_png_bytes or key in self.pngs: return
+        self.pngs[key] = png
+        self.png_bytes += len(png)
+        while self.png_bytes > self.max_png_bytes:
+            self.png_bytes -= len(self.pngs.popitem(last=False)[1])
+            self.evictions += 1
+
+    def store_file_id(self, key : str, file_id : str):
+        """Caches the file_id Telegram returned for the code, its PNG is no longer needed"""
+        png = self.pngs.pop(key, None)
+        if png is not None: self.png_bytes -= len(png)
+        self.file_ids[key] = file_id
+        self.file_ids.move_to_end(key)
+        if len(self.file_ids) > self.max_file_ids:
+            self.file_ids.popitem(last=False)
+            self.evictions += 1
+
+    def forget_file_id(self, key : str):
+        """Removes a file_id Telegram refused"""
+        self.file_ids.pop(key, None)
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the current size of the cache"""
+        lookups = self.file_id_hits + self.png_hits + self.misses
+        return {"file_id_hits" : self.file_id_hits, "png_hits" : self.png_hits, "misses" : self.misses, "hit_rate" : (self.file_id_hits + self.png_hits) / lookups if lookups else 0.0,
+                "evictions" : self.evictions, "file_ids" : len(self.file_ids), "pngs" : len(self.pngs), "png_bytes" : self.png_bytes}
+
+def google_translate(source : str, target : str, texts : list[str]) -> list[str]:
+    """Translates texts from source to target language with Google Translate, blocking"""
+    return features.load("deep_translator").GoogleTranslator(source, target).translate_batch(texts)
+
+class Translation_Cache:
+    """Persistent cache of translations {target language : {source text : translation}}, the translator is any callable with the signature of google_translate.
+    Only the texts used in the last keep_days days are kept, the file is written by flush and not at every translation"""
+    def __init__(self, path : str, translator : callable = google_translate, source : str = "it", keep_days : int = 2):
+        self.path = path
+        self.translator = translator
+        self.source = source
+        self.keep_days = keep_days
+        self.translations = {}
+        self.used = {} #{source text : ordinal of the day it was last used}
+        self.dirty = False #True when the cache has changes not written to path yet
+        self.lock = asyncio.Lock() #Serializes the writes of the cache file
+        self.logger = logging.getLogger(__name__)
+
+    async def load(self):
+        """Loads the cached translations from path, if present"""
+        if not os.path.exists(self.path): return
+        async with aiofiles.open(self.path, "r", encoding="utf-8") as cache_file:
+            try: data = json.loads(await cache_file.read())
+            except json.JSONDecodeError: 
+                self.logger.warning(f"Translations cache {self.path} is corrupted, starting empty")
+                return
+        if "translations" in data: self.translations, self.used = data["translations"], data.get("used", {})
+        else: self.translations = data #cache written before the texts were dated, considered used today
+        today = date.today().toordinal()
+        for cached in self.translations.values():
+            for text in cached: self.used.setdefault(text, today)
+        self.prune()
+
+    def prune(self):
+        """Drops the texts not used in the last keep_days days"""
+        oldest = date.today().toordinal() - self.keep_days + 1
+        expired = {text for text, day in self.used.items() if day < oldest}
+        if not expired: return
+        for cached in self.translations.values():
+            for text in expired & cached.keys(): del cached[text]
+        for text in expired: del self.used[text]
+        self.dirty = True
+
+    def touch(self, text : str):
+        """Marks text as used today"""
+        today = date.today().toordinal()
+        if self.used.get(text) != today:
+            self.used[text] = today
+            self.dirty = True
+
+    async def save(self):
+        """Writes the cached translations to path"""
+        async with self.lock:
+            self.dirty = False
+            await asyncio.to_thread(write_atomically, self.path, json.dumps({"translations" : self.translations, "used" : self.used}, ensure_ascii=False))
+
+    async def flush(self):
+        """Prunes the cache and writes it to path, only if it changed since the last write"""
+        self.prune()
+        if self.dirty: await self.save()
+
+    def get(self, text : str, target : str) -> str | None:
+        """Returns the cached translation of text, None if it wasn't translated yet"""
+        if target == self.source: return text
+        translation = self.translations.get(target, {}).get(text)
+        if translation is not None: self.touch(text)
+        return translation
+
+    async def translate(self, texts : list[str], target : str) -> list[str]:
+        """Returns the translations of texts, translating in the default executor only the ones missing from the cache"""
+        if target == self.source: return list(texts)
+        cached = self.translations.setdefault(target, {})
+        missing = list(dict.fromkeys(text for text in texts if text not in cached))
+        if missing:
+            translated = await asyncio.get_running_loop().run_in_executor(None, self.translator, self.source, target, missing)
+            cached.update({text : translation for text, translation in zip(missing, translated) if translation})
+        for text in texts: self.touch(text)
+        return [cached.get(text, text) for text in texts]
+
+class Random_Name_Generator:
+    """Draws random first names from a pool of Faker instances, one per locale built at the first use. With precompute the names are extracted once into per-gender lists, already transliterated"""
+    def __init__(self, locales : list[str] = ["it_IT", "en_UK", "fr_Fr", "uk_UA", "el_GR", "ja_JP"], seed : int = None, precompute : bool = False):
+        self.locales = locales
+        self.seed = seed #Makes the draws reproducible
+        self.random = random.Random(seed)
+        self.fakers = {} #{locale : Faker}
+        self.names = {} #{locale : {gender : [names]}}, filled only with precompute
+        if precompute:
+            for locale in locales: self.names[locale] = self.extract_names(locale)
+
+    def get_faker(self, locale : str):
+        """Returns the Faker instance of locale, creating it the first time"""
+        fake = self.fakers.get(locale)
+        if fake is None:
+            fake = self.fakers[locale] = features.load("faker").Faker(locale)
+            if self.seed is not None: fake.seed_instance(self.seed)
+        return fake
+
+    def extract_names(self, locale : str) -> dict[str, list[str]]:
+        """Returns the first names of the locale's person provider grouped by gender, transliterated to ASCII"""
+        provider = self.get_faker(locale).provider("faker.providers.person")
+        if locale == "ja_JP":
+            female, male = list(provider.first_romanized_names_female), list(provider.first_romanized_names_male)
+            return {"f" : female, "m" : male, "nb" : female + male}
+        names = {"f" : provider.first_names_female, "m" : provider.first_names_male, "nb" : getattr(provider, "first_names_nonbinary", None) or provider.first_names}
+        unidecode = features.load("unidecode").unidecode
+        return {gender : [unidecode(name) for name in gender_names] for gender, gender_names in names.items()}
+
+    def draw(self, gender : str) -> str:
+        """Returns a random first name of the gender from a random locale"""
+        locale = self.random.choice(self.locales)
+        if locale in self.names: return self.random.choice(self.names[locale].get(gender) or self.names[locale]["nb"])
+        fake = self.get_faker(locale)
+
+        if locale == "ja_JP":
+            if gender == 'f': name = fake.first_romanized_name_female()
+            elif gender == 'm': name = fake.first_romanized_name_male()
+            else: name = self.random.choice([fake.first_romanized_name_male(), fake.first_romanized_name_female()])
+        else:
+            if gender == 'f': name = fake.first_name_female()
+            elif gender == 'm': name = fake.first_name_male()
+            else: name = fake.first_name_nonbinary()
+            name = features.load("unidecode").unidecode(name)
+        return name
+
+class Log_Files_Store:
+    """Log store writing one text file per user, keeping the most recently used files open. Its methods block, Log_Writer calls them in the default executor"""
+    def __init__(self, log_path : str, max_open : int = 128):
+        self.log_path = log_path
+        self.max_open = max_open #Max files kept open, the least recently used is closed first
+        self.files = OrderedDict() #{user_id : open file}
+
+    @staticmethod
+    def format_record(record : dict) -> str:
+        """Returns the line of a log record"""
+        if record["direction"] == "out": return f"Bot: {record["text"]}\n"
+        content = record["text"] if record["type"] == "text" else record["type"]
+        return f"{record["user_id"]}, {record.get("name")}: {content}\n"
+
+    def open(self): os.makedirs(self.log_path, exist_ok=True)
+
+    def write_batch(self, pending : dict[int, list[dict]]):
+        """Appends the records to the users' files"""
+        for user_id, records in pending.items():
+            log_file = self.files.get(user_id)
+            if log_file is None:
+                if len(self.files) >= self.max_open: self.files.popitem(last=False)[1].close()
+                log_file = self.files[user_id] = open(f"{self.log_path}/{user_id}.txt", "a", encoding="utf-8")
+            else: self.files.move_to_end(user_id)
+            log_file.writelines(self.format_record(record) for record in records)
+            log_file.flush()
+
+    def close(self):
+        """Closes every open file"""
+        while self.files: self.files.popitem()[1].close()
+
+class Log_Segment_Store:
+    """Log store appending JSONL records of every user to shared segment files, rotated at segment_size and optionally gzipped.
+    The index lists the segments holding each user's records, the offsets of the records are kept in an offsets file per segment, written once when the segment is rotated"""
+    def __init__(self, log_path : str, segment_size : int = 64 * 1024 * 1024, compress : bool = True):
+        self.log_path = log_path
+        self.segment_size = segment_size
+        self.compress = compress
+        self.index_path = f"{log_path}/segments_index.json"
+        self.index = {"active" : 0, "users" : {}} #active segment and {user_id : [segments holding the user's records]}
+        self.offsets = {} #{user_id : [offsets]} of the records in the active segment
+        self.size = 0 #bytes of the active segment indexed
+        self.file = None
+        self.lock = threading.Lock() #The index is read by history while the writer thread updates it
+
+    def segment_path(self, segment : int, compressed : bool = False) -> str:
+        return f"{self.log_path}/segment_{segment:06d}.jsonl{".gz" if compressed else ""}"
+
+    def offsets_path(self, segment : int) -> str:
+        return f"{self.log_path}/segment_{segment:06d}.offsets.json"
+
+    def open(self):
+        """Loads the index and opens the active segment, indexing the records written after the last index save (i.e. before a crash)"""
+        os.makedirs(self.log_path, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as index_file: self.index = json.load(index_file)
+            if any(isinstance(segments, dict) for segments in self.index["users"].values()): self.upgrade_index()
+        self.offsets, self.size = self.load_offsets(self.index["active"])
+        path = self.segment_path(self.index["active"])
+        if os.path.exists(path) and os.path.getsize(path) > self.size:
+            with open(path, "rb") as segment:
+                segment.seek(self.size)
+                offset = self.size
+                for line in segment:
+                    try: self.index_record(json.loads(line)["user_id"], offset)
+                    except (json.JSONDecodeError, KeyError): break #truncated last line
+                    offset += len(line)
+            with open(path, "r+b") as segment: segment.truncate(offset)
+            self.size = offset
+        self.file = open(path, "ab")
+
+    def upgrade_index(self):
+        """Moves the offsets out of an index written with every offset in it, to the offsets files of the segments"""
+        segments = {} #{segment : {user_id : [offsets]}}
+        for user_id, user_segments in self.index["users"].items():
+            for segment, offsets in user_segments.items(): segments.setdefault(int(segment), {})[user_id] = offsets
+        for segment, offsets in segments.items():
+            self.offsets, self.size = offsets, self.index["size"] if segment == self.index["active"] else None
+            self.save_offsets(segment)
+        self.index = {"active" : self.index["active"], "users" : {user_id : sorted(int(segment) for segment in user_segments) for user_id, user_segments in self.index["users"].items()}} #saved with the next rotation or close
+
+    def load_offsets(self, segment : int) -> tuple[dict[str, list[int]], int]:
+        """Returns the offsets of the records of each user in segment and the bytes of it they cover"""
+        try:
+            with open(self.offsets_path(segment), "r", encoding="utf-8") as offsets_file: data = json.load(offsets_file)
+        except FileNotFoundError: return {}, 0
+        return data["users"], data["size"] or 0
+
+    def save_offsets(self, segment : int):
+        """Writes the offsets of the active segment to the offsets file of segment"""
+        with self.lock: data = json.dumps({"size" : self.size, "users" : self.offsets}, separators=(",", ":"))
+        write_atomically(self.offsets_path(segment), data)
+
+    def index_record(self, user_id : int, offset : int):
+        with self.lock:
+            self.offsets.setdefault(str(user_id), []).append(offset)
+            segments = self.index["users"].setdefault(str(user_id), [])
+            if not segments or segments[-1] != self.index["active"]: segments.append(self.index["active"])
+
+    def save_index(self):
+        """Writes the offsets of the active segment and the index"""
+        self.save_offsets(self.index["active"])
+        with self.lock: data = json.dumps(self.index, separators=(",", ":"))
+        write_atomically(self.index_path, data)
+
+    def write_batch(self, pending : dict[int, list[dict]]):
+        """Appends the records to the active segment, rotating it once it exceeds segment_size. The offsets are indexed once written to disk"""
+        written = [] #[(user_id, offset)]
+        for user_id, records in pending.items():
+            for record in records:
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode()
+                self.file.write(line)
+                written.append((user_id, self.size))
+                self.size += len(line)
+                if self.size >= self.segment_size: 
+                    self.rotate(written)
+                    written = []
+        self.file.flush()
+        for location in written: self.index_record(*location)
+
+    def rotate(self, written : list[tuple[int, int]]):
+        """Closes the active segment, saving its offsets and compressing it if enabled, and starts a new one"""
+        self.file.close()
+        for location in written: self.index_record(*location)
+        self.save_offsets(self.index["active"])
+        path = self.segment_path(self.index["active"])
+        if self.compress:
+            with open(path, "rb") as segment, gzip.open(self.segment_path(self.index["active"], True), "wb") as compressed: shutil.copyfileobj(segment, compressed)
+            os.remove(path)
+        with self.lock:
+            self.index["active"] += 1
+            self.offsets, self.size = {}, 0
+        self.save_index()
+        self.file = open(self.segment_path(self.index["active"]), "ab")
+
+    def history(self, user_id : int, limit : int = None) -> list[dict]:
+        """Returns the records of user_id, oldest first, or only the last limit ones. Only the offsets files of the segments read are loaded"""
+        with self.lock: segments, active, active_offsets = self.index["users"].get(str(user_id), [])[:], self.index["active"], self.offsets.get(str(user_id), [])[:]
+        locations = [] #[(segment, offsets)] newest first
+        remaining = limit
+        for segment in reversed(segments):
+            if remaining is not None and remaining <= 0: break
+            offsets = active_offsets if segment == active else self.load_offsets(segment)[0].get(str(user_id), [])
+            if remaining is not None:
+                offsets = offsets[-remaining:]
+                remaining -= len(offsets)
+            locations.append((segment, offsets))
+        records = []
+        for segment, offsets in reversed(locations):
+            try: segment_file = open(self.segment_path(segment), "rb")
+            except FileNotFoundError: segment_file = gzip.open(self.segment_path(segment, True), "rb") #already rotated and compressed
+            with segment_file:
+                for offset in offsets:
+                    segment_file.seek(offset)
+                    records.append(json.loads(segment_file.readline()))
+        return records
+
+    def convert_files(self, remove : bool = False) -> int:
+        """Appends the old per-user .txt logs in log_path to the segments, returns the records converted. The old files have no timestamps, their modification time is used"""
+        if self.file is None: self.open()
+        converted = 0
+        for name in sorted(os.listdir(self.log_path)):
+            user_id, extension = os.path.splitext(name)
+            if extension != ".txt" or not user_id.lstrip("-").isdigit(): continue
+            path = f"{self.log_path}/{name}"
+            timestamp = os.path.getmtime(path)
+            records = []
+            with open(path, "r", encoding="utf-8") as log_file:
+                for line in log_file:
+                    line = line.rstrip("\n")
+                    if line.startswith("Bot: "): records.append({"ts" : timestamp, "user_id" : int(user_id), "direction" : "out", "type" : "text", "text" : line[5:]})
+                    elif line.startswith(f"{user_id}, ") and ": " in line[len(user_id) + 2:]:
+                        user_name, text = line[len(user_id) + 2:].split(": ", 1)
+                        records.append({"ts" : timestamp, "user_id" : int(user_id), "direction" : "in", "type" : "text", "text" : text, "name" : user_name})
+                    elif records: records[-1]["text"] += "\n" + line #continuation of a multiline message
+            self.write_batch({int(user_id) : records})
+            converted += len(records)
+            if remove: os.remove(path)
+        self.save_index()
+        return converted
+
+    def close(self):
+        """Closes the active segment and saves the index"""
+        if self.file is None: return
+        self.file.close()
+        self.file = None
+        self.save_index()
+
+class Log_Writer:
+    """Writes the log records to a store (Log_Files_Store or Log_Segment_Store) from a single background task: records are queued by the handlers and written in batches"""
+    def __init__(self, store, max_queue : int = 10000, flush_interval : float = 1.0, flush_lines : int = 500, drop_when_full : bool = True):
+        self.store = store
+        self.queue = asyncio.Queue(max_queue)
+        self.flush_interval = flush_interval #Max seconds a record waits in memory
+        self.flush_lines = flush_lines #Records that trigger a write before flush_interval
+        self.drop_when_full = drop_when_full #If False a full queue makes the handlers wait instead of dropping records
+        self.task = None
+        self.written = 0
+        self.dropped = 0
+        self.logger = logging.getLogger(__name__)
+
+    async def write(self, user_id : int, record : dict):
+        """Queues a record of the log of user_id"""
+        if self.task is None: self.task = asyncio.create_task(self.run())
+        if not self.drop_when_full: await self.queue.put((user_id, record))
+        else:
+            try: self.queue.put_nowait((user_id, record))
+            except asyncio.QueueFull: self.dropped += 1
+
+    async def run(self):
+        """Collects the queued records and writes them every flush_interval seconds or flush_lines records, until close queues None"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.store.open)
+        pending = {} #{user_id : [records]}
+        count = 0
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try: item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError: item = False
+            if item is None: stopping = True
+            elif item:
+                pending.setdefault(item[0], []).append(item[1])
+                count += 1
+                if deadline is None: deadline = time.monotonic() + self.flush_interval
+            if pending and (stopping or count >= self.flush_lines or time.monotonic() >= deadline):
+                try: await loop.run_in_executor(None, self.store.write_batch, pending)
+                except OSError as e: self.logger.error(f"Log write failed: {e}")
+                self.written += count
+                pending, count, deadline = {}, 0, None
+        await loop.run_in_executor(None, self.store.close)
+
+    async def history(self, user_id : int, limit : int = None) -> list[dict]:
+        """Returns the logged records of user_id, only supported by Log_Segment_Store"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.store.history, user_id, limit)
+
+    async def close(self):
+        """Writes every queued record and stops the background task"""
+        if self.task is None: return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+class Event_Store:
+    """Pending events of the multimessage commands, kept in memory and expired after ttl seconds. The store is written to path periodically and on shutdown"""
+    def __init__(self, path : str, ttl : float = 900, persist_interval : float = 30):
+        self.path = path
+        self.ttl = ttl #Seconds a prompt waits for the user's answer
+        self.persist_interval = persist_interval
+        self.events = {} #{user_id : (expiry timestamp, event)}
+        self.dirty = False
+        self.task = None
+        self.logger = logging.getLogger(__name__)
+
+    def get(self, user_id : int) -> dict | None:
+        """Returns the pending event of user_id, None if there is none or it expired"""
+        entry = self.events.get(user_id)
+        if entry is None: return None
+        if entry[0] < time.time():
+            self.pop(user_id)
+            return None
+        return entry[1]
+
+    def set(self, user_id : int, event : dict):
+        self.events[user_id] = (time.time() + self.ttl, event)
+        self.dirty = True
+
+    def pop(self, user_id : int) -> dict | None:
+        """Removes and returns the pending event of user_id, if not expired"""
+        entry = self.events.pop(user_id, None)
+        if entry is None: return None
+        self.dirty = True
+        return entry[1] if entry[0] >= time.time() else None
+
+    def purge(self):
+        """Removes the expired events"""
+        now = time.time()
+        expired = [user_id for user_id, (expiry, event) in self.events.items() if expiry < now]
+        for user_id in expired: del self.events[user_id]
+        if expired: self.dirty = True
+
+    async def load(self):
+        """Loads the events saved at the last shutdown, dropping the expired ones"""
+        if not os.path.exists(self.path): return
+        async with aiofiles.open(self.path, "r", encoding="utf-8") as events_file:
+            try: self.events = {int(user_id) : tuple(entry) for user_id, entry in json.loads(await events_file.read()).items()}
+            except (json.JSONDecodeError, ValueError, TypeError): self.logger.warning(f"Events file {self.path} is corrupted, starting empty")
+        self.purge()
+
+    async def save(self):
+        """Writes the events to path if they changed"""
+        if not self.dirty: return
+        self.dirty = False
+        await asyncio.to_thread(write_atomically, self.path, json.dumps({user_id : list(entry) for user_id, entry in self.events.items()}))
+
+    async def persist_periodically(self):
+        """Purges the expired events and saves the store every persist_interval seconds"""
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            self.purge()
+            try: await self.save()
+            except OSError as e: 
+                self.dirty = True
+                self.logger.error(f"Events save failed: {e}")
+
+    async def open(self):
+        await self.load()
+        self.task = asyncio.create_task(self.persist_periodically())
+
+    async def close(self):
+        """Stops the periodic task and saves the events"""
+        if self.task: self.task.cancel()
+        self.purge()
+        await self.save()
+
+class Target_Index:
+    """In-memory index of the users' usernames and first names for the target picker: sorted keys for prefix searches and pages, trigrams for fuzzy searches"""
+    def __init__(self):
+        self.names = {} #{user_id : (username, first_name)}
+        self.keys = [] #Sorted [(casefolded name, user_id)] of usernames and first names
+        self.labels = [] #Sorted [(casefolded label, user_id)], one per user, to browse every user
+        self.trigrams = {} #{trigram : set(user_id)}
+        self.ready = False
+
+    @staticmethod
+    def trigrams_of(name : str) -> set[str]:
+        padded = f"  {name} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def user_keys(self, user_id : int) -> list[str]:
+        return list(dict.fromkeys(name.casefold() for name in self.names.get(user_id, ()) if name))
+
+    def label(self, user_id : int) -> str:
+        """Returns the username of the user, or the first name if it has none"""
+        username, first_name = self.names.get(user_id, (None, None))
+        return username or first_name or str(user_id)
+
+    def build(self, users : list[tuple[int, str | None, str | None]]):
+        """Indexes every user of [(user_id, username, first_name)] from scratch, sorting the keys once"""
+        self.names = {user_id : (username, first_name) for user_id, username, first_name in users}
+        self.keys, self.labels, self.trigrams = [], [], {}
+        for user_id in self.names:
+            for key in self.user_keys(user_id):
+                self.keys.append((key, user_id))
+                for trigram in self.trigrams_of(key): self.trigrams.setdefault(trigram, set()).add(user_id)
+            self.labels.append((self.label(user_id).casefold(), user_id))
+        self.keys.sort()
+        self.labels.sort()
+        self.ready = True
+
+    def add(self, user_id : int, username : str | None, first_name : str | None):
+        """Indexes a user, replacing its previous names. Used to keep the built index updated"""
+        if self.names.get(user_id) == (username, first_name): return
+        self.remove(user_id)
+        self.names[user_id] = (username, first_name)
+        for key in self.user_keys(user_id):
+            bisect.insort(self.keys, (key, user_id))
+            for trigram in self.trigrams_of(key): self.trigrams.setdefault(trigram, set()).add(user_id)
+        bisect.insort(self.labels, (self.label(user_id).casefold(), user_id))
+
+    def remove(self, user_id : int):
+        if user_id not in self.names: return
+        for key in self.user_keys(user_id):
+            position = bisect.bisect_left(self.keys, (key, user_id))
+            if position < len(self.keys) and self.keys[position] == (key, user_id): del self.keys[position]
+            for trigram in self.trigrams_of(key): self.trigrams.get(trigram, set()).discard(user_id)
+        position = bisect.bisect_left(self.labels, (self.label(user_id).casefold(), user_id))
+        if position < len(self.labels) and self.labels[position][1] == user_id: del self.labels[position]
+        del self.names[user_id]
+
+    def page(self, query : str, cursor : int, size : int) -> tuple[list[int], int | None]:
+        """Returns up to size users whose names start with query (every user if query is empty) from cursor on, and the cursor of the next page or None"""
+        if not query:
+            users = [user_id for label, user_id in self.labels[cursor:cursor + size]]
+            return users, cursor + size if cursor + size < len(self.labels) else None
+        query = query.casefold()
+        start = bisect.bisect_left(self.keys, (query,))
+        position = start + cursor
+        users = []
+        while position < len(self.keys) and self.keys[position][0].startswith(query) and len(users) < size:
+            if self.listed(position, query): users.append(self.keys[position][1])
+            position += 1
+        more = position < len(self.keys) and self.keys[position][0].startswith(query)
+        return users, position - start if more else None
+
+    def previous_cursor(self, query : str, cursor : int, size : int) -> int:
+        """Returns the cursor of the page before the one starting at cursor, walking back over size listed users"""
+        if not query: return max(cursor - size, 0)
+        query = query.casefold()
+        start = bisect.bisect_left(self.keys, (query,))
+        position, listed = start + cursor, 0
+        while position > start and listed < size:
+            position -= 1
+            if self.listed(position, query): listed += 1
+        return position - start
+
+    def listed(self, position : int, query : str) -> bool:
+        """Returns True if the key at position lists its user in the results of query, a user matching with both names is listed once"""
+        key, user_id = self.keys[position]
+        return key == min(user_key for user_key in self.user_keys(user_id) if user_key.startswith(query))
+
+    def fuzzy(self, query : str, size : int, min_similarity : float = 0.3) -> list[int]:
+        """Returns up to size users whose names share the most trigrams with query, for searches with typos"""
+        query_trigrams = self.trigrams_of(query.casefold())
+        shared = Counter(user_id for trigram in query_trigrams for user_id in self.trigrams.get(trigram, ()))
+        scores = {}
+        for user_id in shared:
+            for key in self.user_keys(user_id):
+                key_trigrams = self.trigrams_of(key)
+                common = len(query_trigrams & key_trigrams)
+                scores[user_id] = max(scores.get(user_id, 0), common / len(query_trigrams | key_trigrams))
+        return [user_id for user_id, score in sorted(scores.items(), key=lambda item: -item[1]) if score >= min_similarity][:size]
+
+async def aiter_of(iterable):
+    """Async iterator over a regular iterable"""
+    for item in iterable: yield item
+
+@dataclass(slots=True)
+class UserProfile:
+    """Snapshot of a user document, read once per update and shared by the getters, already resolved with the bot defaults"""
+    user_id : int
+    first_name : str | None = None
+    last_name : str | None = None
+    username : str | None = None
+    chat_id : int | None = None
+    lang : str | None = None
+    gender : str | None = None
+    admin : bool = False
+    permissions : dict = field(default_factory=dict)
+    botname : str | None = None
+    botname_version : int | None = None #banned lists version the botname was last validated against
+    sentence : str | None = None
+    notifications : bool = True
+    found : bool = False #False if the user isn't in the database yet
 
 class Bot(AsyncTeleBot):
-    def __init__(self, token : str, owner_id : int, db_path : str, log_path : str="logs", log : bool=False, dev_mode : bool=False, commands : dict[str, list[types.BotCommand]]=commands, languages : dict[str, str]={"en" : "English", "it" : "Italiano"}, default_language : str = "en", localizations : dict[str, dict[str, str]]=localizations, genders : list=["m", "f", "nb"]):
+    def __init__(self, token : str, owner_id : int, db_path : str, log_path : str="logs", log : bool=False, dev_mode : bool=False, commands : dict[str, list[types.BotCommand]]=commands, languages : dict[str, str]={"en" : "English", "it" : "Italiano"}, default_language : str = "en", localizations : dict[str, dict[str, str]]=localizations, genders : list=["m", "f", "nb"], write_behind : bool = False, db_backend : str = None, qr_workers : int = 2, translations_path : str = "translations.json", translator : callable = google_translate, name_seed : int = None, precompute_names : bool = False, log_mode : str = "files", events_path : str = "events.json", event_ttl : float = 900,
+                 permission_defaults : dict[str, bool] = dict.fromkeys(["lang", "setname", "resetname", "sendtoowner", "sendtoadmin", "gender", "randomname", "qrcode", "setpersonname", "resetpersonname", "setpersonpermission",
+                                                                      "getpersonpermission", "setpersonsentence", "setpersonlang", "setpersongender", "sendto", "broadcast", "addbanned", "removebanned", "addcommand"], True)):
         """Inits the bot by setting up database and basic configuration"""
         super().__init__(token)
         self.OWNER_ID = owner_id
-        self.db = Bot_DB_Manager(db_path, "users", "banned_words", "custom_commands")
+        self.db = Bot_DB_Manager(db_path, "users", "banned_words", "custom_commands", "meta", backend=db_backend, write_behind=write_behind) #db_backend defaults to the db_path scheme/extension, write_behind batches the writes
         self.log_path = log_path
         os.makedirs(self.log_path, exist_ok=True)
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
+        log_store = Log_Segment_Store(self.log_path) if log_mode == "segments" else Log_Files_Store(self.log_path) #files writes one .txt per user, segments shared JSONL files
+        self.log_writer = Log_Writer(log_store) #Background writer of the logs
 
         self.LOG = log #when enabled logs messages to console and file
         self.DEV_MODE = dev_mode #when enabled the bot status notification is disabled
@@ -65,7 +1416,33 @@ class Bot(AsyncTeleBot):
         self.default_language = default_language
         self.commands = commands #Dict containing the commands shown in telegram menù in various languages
         self.localizations = localizations #A dict containing the texts used by the bot: {source: {lang : [element]}} 
+        self.localized_strings = self.compile_localizations() #{lang : {(source, element) : text}}, with the fallbacks already applied
         self.genders = genders #List of genders the bots uses to create the menù
+        self.permission_defaults = permission_defaults #{command : allowed}, users store only the commands differing from these. Commands not listed are allowed
+        self.banned_matcher = None #Banned_Words_Matcher compiled from the banned lists, reset whenever a list changes
+        self.banned_version = None #Version of the banned lists, increased at every change. Botnames store the version they were validated against
+        self.sweep_task = None #Background revalidation of the botnames after a banned lists change
+        self.broadcaster = Broadcast_Engine() #Rate limits the messages sent by broadcasts, notifications and sendto
+        self.qr_workers = qr_workers #Processes rendering the QR codes, so big payloads don't block the event loop
+        self.qr_pool = None #ProcessPoolExecutor started by main, or at the first QR code
+        self.qr_params = {"error_correction" : "M", "box_size" : 10, "border" : 4} #Rendering parameters, part of the cache key
+        self.qr_cache = QR_Code_Cache()
+        self.wikipedia_events = [] #Events of events_date parsed from Italian Wikipedia, refreshed every midnight
+        self.events_date = None
+        self.events_lock = asyncio.Lock()
+        self.events_task = None
+        self.translations = Translation_Cache(translations_path, translator) #Translations of the events, filled in background for every language
+        self.translation_task = None
+        self.translate_events = translator is not google_translate or features.available("translator") #Without the translator the events are sent in Italian
+        self.translation_backoff = 300 #Seconds without translation attempts after a failure
+        self.translation_retry_at = 0.0 #time.monotonic() before which the translation isn't retried
+        self.target_index = Target_Index() #Names of the users for the admin target picker, built at the first use
+        self.picker_size = 8 #Users per page of the target picker
+        self.admins = None #{user_id : chat_id} of the admins, loaded from the database at the first use
+        self.custom_commands = None #{name : content} of the custom commands, loaded from the database at the first use
+        self.pending_events = Event_Store(events_path, event_ttl) #Events of the multimessage commands waiting for the user's answer
+        self.name_generator = Random_Name_Generator(seed=name_seed, precompute=precompute_names and features.available("randomname"))
+        self.disabled_commands = features.disabled_commands() #Commands whose optional dependencies aren't installed
         #List of functions authorized to be executed by the event system
         self.functions = {"validate_target" : self.validate_target, "set_botname" : self.set_botname, "send_message_to" : self.send_message_to, "broadcast" : self.broadcast, "generate_qrcode" : self.generate_qrcode, "reset_botname" : self.reset_botname,
                     "ask_custom_command_content" : self.ask_custom_command_content, "add_custom_command" : self.add_custom_command, "remove_custom_command" : self.remove_custom_command, "set_excl_sentence" : self.set_excl_sentence,
@@ -73,6 +1450,7 @@ class Bot(AsyncTeleBot):
                     "add_banned_words" : self.add_banned_words, "remove_banned_words" : self.remove_banned_words, "handle_multiple_users" : self.handle_multiple_users}
         
         #Register handlers
+        if self.disabled_commands: self.register_message_handler(self.feature_unavailable, commands=list(self.disabled_commands)) #Registered first to take precedence
         self.register_message_handler(self.send_greets, commands=["start", "hello"])
         self.register_message_handler(self.set_user_lang, commands=["lang"])
         self.register_message_handler(self.set_name, commands=["setname"])
@@ -112,116 +1490,158 @@ class Bot(AsyncTeleBot):
         self.register_message_handler(self.handle_events, content_types=["text","photo", "video", "sticker", "animation", "document", "audio", "voice"],func= lambda commands:True)
         self.register_callback_query_handler(self.handle_lang_buttons, func=lambda call: call.data.startswith("lang_"))
         self.register_callback_query_handler(self.handle_gender_buttons, func=lambda call: call.data.startswith("gender_"))
-
-    async def store_user_data(self, user, chat_id : int):
-        """Creates and updates the user data in the database"""
+        self.register_callback_query_handler(self.handle_target_buttons, func=lambda call: call.data.startswith("target"))
+
+    async def get_profile(self, us_id : int) -> UserProfile:
+        """Returns the UserProfile of the user identified by us_id with a single database read"""
+        doc = await self.db.get_cached_doc("users", us_id)
+        if doc is None: return UserProfile(us_id, lang=self.default_language, gender=self.genders[0], admin=us_id == self.OWNER_ID)
+
+        commands = doc.get("commands")
+        if not isinstance(commands, dict): commands = {}
+        admin = doc.get("admin_status")
+        notifications = doc.get("notifications")
+        return UserProfile(us_id, first_name=doc.get("first_name"), last_name=doc.get("last_name"), username=doc.get("username"), chat_id=doc.get("chat_id"), lang=doc.get("localization") or self.default_language, gender=doc.get("gender") or self.genders[0],
+                           admin=us_id == self.OWNER_ID if admin == None else admin, permissions=commands, botname=doc.get("bot_name"), botname_version=doc.get("bot_name_version"),
+                           sentence=doc.get("exclusive_sentence"), notifications=True if notifications == None else notifications, found=True)
+
+    async def store_user_data(self, user, chat_id : int, profile : UserProfile = None) -> UserProfile:
+        """Creates and updates the user data in the database, returns the updated profile"""
+        if profile is None: profile = await self.get_profile(user.id)
         user_data = {
             "user_id" : user.id,
             "first_name" : user.first_name,
             "last_name" : user.last_name,
             "username" : user.username,
             "is_bot" : user.is_bot,
-            "bot_name" : await self.get_botname(user.id),
+            "bot_name" : await self.get_botname(user.id, profile),
+            "bot_name_version" : profile.botname_version,
             "chat_id" : chat_id,
-            "commands" : await self.get_permission(user.id),
-            "admin_status" : await self.get_admin(user.id),
-            "exclusive_sentence" : await self.get_excl_sentence(user.id),
-            "notifications" : await self.get_notification_status(user.id),
-            "localization" : await self.get_lang(user.id),
-            "gender" : await self.get_gender(user.id),
-            "event" : await self.get_event(user.id)
+            "commands" : profile.permissions,
+            "admin_status" : profile.admin,
+            "exclusive_sentence" : profile.sentence,
+            "notifications" : profile.notifications,
+            "localization" : profile.lang,
+            "gender" : profile.gender
             }
         await self.db.upsert_values("users", user_data, self.db.query.user_id == user.id)
+        profile.first_name, profile.last_name, profile.username, profile.chat_id, profile.found = user.first_name, user.last_name, user.username, chat_id, True
+        if self.admins is not None and user.id in self.admins: self.admins[user.id] = chat_id
+        if self.target_index.ready: self.target_index.add(user.id, user.username, user.first_name)
+        return profile
 
     async def check_banned_name(self, name : str) -> bool:
         """Return true if name is banned, false otherwise"""
-        banned_words = await self.get_banned_words("banned")
-        ultra_banned_words = await self.get_banned_words("ultrabanned")
-        numToCh = [{'1' : 'i', '3' : 'e', '4' : 'r', '0' : 'o', '7' : 'l', '5' : 's', '$': 'e', '€':'e', 'т' : 't', 'п' : 'n', '\u03c5' : 'u', '\u0435' : 'e', 'ε' : 'e', '6' : 'g'},
-                    {'1' : 'i', '3' : 'e', '4' : 'a', '0' : 'o', '7' : 'l', '5' : 's', '$': 'e', '€':'e', 'т' : 't', 'п' : 'n', '\u03c5' : 'u', '\u0435' : 'e', 'ε' : 'e', '6' : 'g'}]
-        for charset in numToCh:
-            wordname = ""
-            for char in name:
-                car = char
-                try:
-                    car = charset[char]
-                except KeyError: pass
-                if car == ' ': continue
-                wordname += car.lower()
-
-            if wordname in banned_words: return True
-            elif wordname[::-1] in banned_words: return True
-
-            for word in ultra_banned_words:
-                if word in wordname: return True
-                elif word[::-1] in wordname: return True
+        if self.banned_matcher is None: self.banned_matcher = Banned_Words_Matcher(await self.get_banned_words("banned"), await self.get_banned_words("ultrabanned"))
+        return self.banned_matcher.matches(name)
 
     async def logging_procedure(self, message, bot_answer : str):
         """Standard logging, to a file and console, of the user and bot messages not registered by log function automatically"""
         if self.LOG:
             await self.log_and_update(message)
             self.logger.info(f"Bot: {bot_answer}")
-            async with aiofiles.open(f"{self.log_path}/{message.from_user.id}.txt", "a") as log_file:
-                await log_file.write(f"Bot: {bot_answer}\n")
+            await self.log_writer.write(message.from_user.id, {"ts" : time.time(), "user_id" : message.from_user.id, "direction" : "out", "type" : "text", "text" : bot_answer})
+
+    def compile_localizations(self) -> dict[str, dict[tuple[str, str | None], str]]:
+        """Flattens localizations into a table per language, texts missing in a language fall back to the default language and then to not_found. The missing texts are logged"""
+        langs = list(dict.fromkeys([*self.languages, self.default_language]))
+        not_found = self.localizations.get("not_found", {})
+        tables = {lang : {("not_found", None) : not_found.get(lang) or not_found.get(self.default_language) or not_found.get("en", "")} for lang in langs}
+        missing = []
+        for source, texts in self.localizations.items():
+            elements = list(dict.fromkeys(element for text in texts.values() if isinstance(text, dict) for element in text))
+            for lang in langs:
+                table = tables[lang]
+                text = texts.get(lang)
+                if text is None: missing.append(f"{source} [{lang}]")
+                text = text if text is not None else texts.get(self.default_language)
+                if text is not None: table[(source, None)] = text
+                for element in elements:
+                    if isinstance(text, dict) and element in text: table[(source, element)] = text[element]
+                    else:
+                        if text is not None: missing.append(f"{source}.{element} [{lang}]")
+                        fallback = texts.get(self.default_language)
+                        table[(source, element)] = fallback[element] if isinstance(fallback, dict) and element in fallback else table[("not_found", None)]
+        if missing: self.logger.warning(f"Localizations missing, the default language is used: {", ".join(missing)}")
+        return tables
 
     def get_localized_string(self, source : str, lang : str, element : str = None) -> str:
         """Returns the string from localizations.py in localizations[source][lang] and optionally elements"""
-        try:
-            if element: return self.localizations[source][lang][element]
-            return self.localizations[source][lang]
-        except KeyError:
-            try: return self.localizations["not_found"][lang]
-            except KeyError: return self.localizations["not_found"]["en"]
+        table = self.localized_strings.get(lang) or self.localized_strings[self.default_language]
+        text = table.get((source, element or None))
+        return text if text is not None else table[("not_found", None)]
 
-    async def permission_denied_procedure(self, message, error_msg : str = ""):
+    async def permission_denied_procedure(self, message, error_msg : str = "", profile : UserProfile = None):
         """Standard procedure, whenever a user doesn't have the permission to do a certain action"""
         user = message.from_user
-        lang = await self.get_lang(user.id)
+        lang = await self.get_lang(user.id, profile)
         bot_answer = f"{self.get_localized_string("permission_denied", lang, "default")}\n{self.get_localized_string("permission_denied", lang, str(error_msg))}"
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
 
+    async def group_recipients(self, condition : callable) -> dict[int, str]:
+        """Returns {chat_id : language} for the users satisfying condition(user), read in a single pass over the users table and ordered by language"""
+        groups = {} #{language : [chat_id]}
+        async for user in self.db.iterate("users"):
+            if user.get("chat_id") and condition(user): groups.setdefault(user.get("localization") or self.default_language, []).append(user["chat_id"])
+        return {chat_id : lang for lang, chat_ids in groups.items() for chat_id in chat_ids}
+
+    async def admin_recipients(self) -> dict[int, str]:
+        """Returns {chat_id : language} of the admins from the admin roster, ordered by language"""
+        groups = {} #{language : [chat_id]}
+        for us_id, chat_id in (await self.get_admins()).items():
+            if chat_id: groups.setdefault(await self.get_lang(us_id), []).append(chat_id)
+        return {chat_id : lang for lang, chat_ids in groups.items() for chat_id in chat_ids}
+
     async def send_on_off_notification(self, status : str):
         """Sends a notification whenever the bot turns on or off"""
         if not self.DEV_MODE:
-            async for user in self.db.tables["users"]:
-                bot_answer = f"{self.get_localized_string("notifications", await self.get_lang(user["user_id"]), "bot")} {status}!"
-                try: 
-                    if user["chat_id"] and await self.get_notification_status(user["user_id"]):
-                        await self.send_message(user["chat_id"], bot_answer)
-                        if self.LOG: self.logger.info(f"Bot: {bot_answer}. chat_id: {user["chat_id"]}")
-                except (KeyError, telebot.apihelper.ApiTelegramException): pass
+            recipients = await self.group_recipients(lambda user: user.get("notifications") != False)
+            answers = {lang : f"{self.get_localized_string("notifications", lang, "bot")} {status}!" for lang in set(recipients.values())}
+
+            async def send(chat_id : int):
+                bot_answer = answers[recipients[chat_id]]
+                await self.broadcaster.request(chat_id, lambda: self.send_message(chat_id, bot_answer))
+                if self.LOG: self.logger.info(f"Bot: {bot_answer}. chat_id: {chat_id}")
+
+            counts = await self.broadcaster.run(list(recipients), send)
+            if self.LOG: self.logger.info(f"Notification {status}: {counts}")
 
     def generate_random_name(self, gender : str) -> str:
         """Return a random name between names from Italian, english, French, Ukranian, greek and japanese names"""
-        langs = ["it_IT", "en_UK", "fr_Fr", "uk_UA", "el_GR", "ja_JP"]
-        lang = random.choice(langs)
-        fake = faker.Faker(lang)
+        return self.name_generator.draw(gender)
 
-        if lang == "ja_JP":
-            if gender == 'f': name = fake.first_romanized_name_female()
-            elif gender == 'm': name = fake.first_romanized_name_male()
-            else: name = random.choice([fake.first_romanized_name_male(), fake.first_romanized_name_female()])
-        else:
-            if gender == 'f': name = fake.first_name_female()
-            elif gender == 'm': name = fake.first_name_male()
-            else: name = fake.first_name_nonbinary()
-            name = unidecode.unidecode(name)
-        return name
+    def start_qr_pool(self) -> ProcessPoolExecutor:
+        """Returns the pool rendering the QR codes, starting it if needed. Workers are started with forkserver (spawn where unavailable), a fork would copy the event loop, the threads and the open connections"""
+        if self.qr_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self.qr_pool = ProcessPoolExecutor(max_workers=self.qr_workers, mp_context=multiprocessing.get_context(method))
+        return self.qr_pool
 
     async def generate_qrcode(self, message, chat_id : int):
         """Generates a qr code from a string of text"""
         user = message.from_user
         lang = await self.get_lang(user.id)
         bot_answer = self.get_localized_string("sent", lang)
-        img_path = f"qr_{user.id}.png"
+        key = self.qr_cache.key(message.text, self.qr_params)
 
-        img = qrcode.make(message.text)
-        img.save(img_path)
         try:
-            with open(img_path, "rb") as code:
-                await self.send_photo(chat_id, code)
-            os.remove(img_path)
+            file_id = self.qr_cache.get_file_id(key)
+            if file_id is not None:
+                try: await self.send_photo(chat_id, file_id)
+                except telebot.asyncio_helper.ApiTelegramException as e:
+                    if e.error_code == 403: raise
+                    self.qr_cache.forget_file_id(key) #Telegram refused the file_id, the code is uploaded again
+                    file_id = None
+            if file_id is None:
+                png = self.qr_cache.get_png(key)
+                if png is None:
+                    png = await asyncio.get_running_loop().run_in_executor(self.start_qr_pool(), render_qrcode, message.text, self.qr_params)
+                    self.qr_cache.store_png(key, png)
+                code = BytesIO(png)
+                code.name = "qrcode.png"
+                sent = await self.send_photo(chat_id, code)
+                if sent and sent.photo: self.qr_cache.store_file_id(key, sent.photo[-1].file_id)
         except Exception as e: bot_answer = f"{self.get_localized_string("qrcode", lang, "error")} {await self.get_viewed_name(self.OWNER_ID)}: \n{e}"
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
@@ -245,35 +1665,49 @@ class Bot(AsyncTeleBot):
         
         return True
 
-    async def get_botname(self, us_id : int) -> str | None:
+    async def get_botname(self, us_id : int, profile : UserProfile = None) -> str | None:
         """Returns the botname of the user identified by us_id"""
-        botname = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "bot_name")
-        if botname: 
-            if await self.check_banned_name(botname):
-                botname = None
-                await self.db.upsert_values("users", {"bot_name" : botname}, self.db.query.user_id == us_id)
+        if profile is None: profile = await self.get_profile(us_id)
+        botname = profile.botname
+        if botname and profile.botname_version != await self.get_banned_version(): #validated only once per banned lists version
+            version = self.banned_version
+            banned = await self.check_banned_name(botname)
+            if await self.store_botname_check(us_id, botname, banned, version):
+                if banned: botname = profile.botname = None
+                profile.botname_version = version
         return botname
 
+    async def store_botname_check(self, us_id : int, botname : str, banned : bool, version : int) -> bool:
+        """Stores the result of a botname check, only if the botname wasn't changed meanwhile. Returns True if it was stored"""
+        if await self.db.get_cached_doc("users", us_id, "bot_name") != botname: return False #the new botname has its own version
+        data = {"bot_name" : None, "bot_name_version" : version} if banned else {"bot_name_version" : version}
+        await self.db.upsert_values("users", data, self.db.query.user_id == us_id)
+        return True
+
     async def set_botname(self, message, us_id : int, randomName : bool=False):
         """Updates the botname of the user identified by us_id"""
         user = message.from_user
         name = message.text
         lang = await self.get_lang(user.id)
-        if randomName or name == "-r": name = self.generate_random_name(await self.get_gender(us_id))
+        if randomName or name == "-r": 
+            if not features.available("randomname"):
+                await self.feature_unavailable(message)
+                return
+            name = self.generate_random_name(await self.get_gender(us_id))
         
         if not await self.validate_name(message, name): return
         
         target_viewed_name = await self.get_viewed_name(us_id)
         if user.id == us_id: bot_answer = f"{self.get_localized_string("set_name", lang, "personal_name")} {name}"
         else: bot_answer = f"{self.get_localized_string("set_name", lang, "name_of")} {target_viewed_name} {self.get_localized_string("set_name", lang, "is_now")} {name}"
-        await self.db.upsert_values("users", {"bot_name" : name}, self.db.query.user_id == us_id)
+        await self.db.upsert_values("users", {"bot_name" : name, "bot_name_version" : await self.get_banned_version()}, self.db.query.user_id == us_id)
 
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
 
     async def reset_botname(self, message, us_id : int):
         """Reset the name of a user identified by us_id"""
-        target_name = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "first_name")
+        target_name = await self.db.get_cached_doc("users", us_id, "first_name")
         user = message.from_user
         lang = await self.get_lang(user.id)
 
@@ -283,36 +1717,36 @@ class Bot(AsyncTeleBot):
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
 
-    async def get_viewed_name(self, us_id : int) -> str | None:
+    async def get_viewed_name(self, us_id : int, profile : UserProfile = None) -> str | None:
         """Returns the currently visualized name in the bot"""
-        if await self.get_botname(us_id): user_name = await self.get_botname(us_id)
-        else: user_name = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "first_name")
+        if profile is None: profile = await self.get_profile(us_id)
+        user_name = await self.get_botname(us_id, profile)
+        if not user_name: user_name = profile.first_name
         return user_name
 
-    async def get_chat_id(self, us_id : int) -> int | None:
+    async def get_chat_id(self, us_id : int, profile : UserProfile = None) -> int | None:
         """Return the chat id stored in the database"""
-        return await self.db.get_single_doc("users", self.db.query.user_id == us_id, "chat_id")
+        if profile is None: profile = await self.get_profile(us_id)
+        return profile.chat_id
 
-    async def get_permission(self, us_id : int, command : str = None) -> bool | dict | str:
+    async def get_permission(self, us_id : int, command : str = None, profile : UserProfile = None) -> bool | dict | str:
         """Returns true if the user can use a command, false if restricted. If no command is specified returns a dict"""
-        if not await self.db.contains("users", self.db.query.user_id == us_id): return "not_found"
-        commands = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "commands")
-        if command == None: 
-            try:
-                if commands != None and commands != "not_found": return commands
-                else: return {}
-            except KeyError: return {}
-        try:
-            if commands[command] != None: return commands[command]
-            else: raise KeyError
-        except KeyError:
-            data = commands
-            data[command] = True
-            await self.db.upsert_values("users", {"commands" : data}, self.db.query.user_id == us_id)
-            return True
-        except TypeError:
-            await self.db.upsert_values("users", {"commands" : {}}, self.db.query.user_id == us_id)
-            return await self.get_permission(us_id, command)
+        if profile is None: profile = await self.get_profile(us_id)
+        if not profile.found: return "not_found"
+        overrides = profile.permissions #Only the commands differing from the defaults
+        if command == None: return {**self.permission_defaults, **overrides}
+        return overrides.get(command, self.permission_defaults.get(command, True))
+
+    async def migrate_permissions(self):
+        """Compacts the commands dicts written before the permission defaults, keeping only the values differing from the defaults.
+        The defaults used are recorded in the meta table, so the scan runs again only when they change"""
+        if await self.get_meta("permissions_migration", "defaults") == self.permission_defaults: return
+        async for user in self.db.iterate("users", ("user_id", "commands")):
+            commands = user.get("commands")
+            if not isinstance(commands, dict) or not commands: continue
+            overrides = {command : allowed for command, allowed in commands.items() if allowed != self.permission_defaults.get(command, True)}
+            if overrides != commands: await self.db.upsert_values("users", {"commands" : overrides}, self.db.query.user_id == user["user_id"])
+        await self.set_meta("permissions_migration", {"defaults" : self.permission_defaults})
 
     async def set_permission(self, message, us_id : int):
         """Updates the status of a command for the user identified by us_id"""
@@ -321,20 +1755,22 @@ class Bot(AsyncTeleBot):
             await self.permission_denied_procedure(message, "target_admin")
             return
         
-        viewed_name = await self.get_viewed_name(us_id)
+        profile = await self.get_profile(us_id)
+        viewed_name = await self.get_viewed_name(us_id, profile)
         user = message.from_user
         lang = await self.get_lang(user.id)
-        if await self.get_permission(us_id, message.text) == True: bot_answer = f"{self.get_localized_string("permission", lang, "permission_of")} {viewed_name} {self.get_localized_string("permission", lang, "locked")}"
+        allowed = await self.get_permission(us_id, message.text, profile)
+        if allowed == True: bot_answer = f"{self.get_localized_string("permission", lang, "permission_of")} {viewed_name} {self.get_localized_string("permission", lang, "locked")}"
         else: bot_answer = f"{self.get_localized_string("permission", lang, "permission_of")} {viewed_name} {self.get_localized_string("permission", lang, "unlocked")}"
 
-        permissions = await self.get_permission(us_id)
-
-        if us_id == user.id and not permissions[message.text] and us_id != self.OWNER_ID:
+        if us_id == user.id and not allowed and us_id != self.OWNER_ID:
             await self.permission_denied_procedure(message, "admin_only")
             return
 
-        permissions[message.text] = not await self.get_permission(us_id, message.text)
-        await self.db.upsert_values("users", {"commands" : permissions}, self.db.query.user_id == us_id)
+        overrides = dict(profile.permissions)
+        if (not allowed) == self.permission_defaults.get(message.text, True): overrides.pop(message.text, None)
+        else: overrides[message.text] = not allowed
+        await self.db.upsert_values("users", {"commands" : overrides}, self.db.query.user_id == us_id, flush=True)
 
         await self.reply_to(message, bot_answer, reply_markup=types.ReplyKeyboardRemove())
         await self.logging_procedure(message, bot_answer)
@@ -344,15 +1780,57 @@ class Bot(AsyncTeleBot):
         user = message.from_user
         lang = await self.get_lang(user.id)
 
-        if await self.get_permission(us_id):
-            bot_answer = f"{self.get_localized_string("permission", lang, "list")} {await self.get_viewed_name(us_id)}: \n"
-            for command, permission in (await self.get_permission(us_id)).items():
-                bot_answer += f"{command}: {permission};\n"
-        else: bot_answer = self.get_localized_string("choose_argument", lang, "not_found")
+        permissions = await self.get_permission(us_id)
+        if isinstance(permissions, dict):
+            header = f"{self.get_localized_string("permission", lang, "list")} {await self.get_viewed_name(us_id)}: "
+            await self.send_report(message, header, [f"{command}: {permission};" for command, permission in permissions.items()])
+            return
 
+        bot_answer = self.get_localized_string("choose_argument", lang, "not_found")
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
 
+    async def send_report(self, message, header : str, entries, separator : str = "\n", page_size : int = 4096, max_pages : int = 5):
+        """Replies with header and entries (iterable or async iterable) sending each message as soon as it's filled up to page_size characters.
+        The entries beyond max_pages messages are sent as a text document"""
+        pages = 0
+        count = 0
+        page = header
+        document = None
+
+        async def send_page(text : str):
+            nonlocal pages
+            if pages: await self.send_message(message.chat.id, text)
+            else: await self.reply_to(message, text)
+            pages += 1
+
+        if not hasattr(entries, "__aiter__"): entries = aiter_of(entries)
+        async for entry in entries:
+            count += 1
+            if document is not None:
+                document.write(f"{entry}{separator}")
+                continue
+            text = f"{page}{separator}{entry}" if page else entry
+            if len(text) <= page_size:
+                page = text
+                continue
+            if page: await send_page(page)
+            while len(entry) > page_size: #Entries longer than a message are split
+                await send_page(entry[:page_size])
+                entry = entry[page_size:]
+            page = entry
+            if pages >= max_pages:
+                document = StringIO()
+                document.write(f"{page}{separator}")
+                page = ""
+
+        if document is not None:
+            report = BytesIO(document.getvalue().encode())
+            report.name = "report.txt"
+            await self.send_document(message.chat.id, report, caption=header[:1024] or None)
+        elif page or not pages: await send_page(page or header)
+        await self.logging_procedure(message, page if pages <= 1 and document is None else f"{header} [{count} entries, {pages} messages{", document" if document else ""}]")
+
     async def handle_lang_buttons(self, call):
         """Callback when a button related to language selection is pressed"""
         user = call.from_user
@@ -362,11 +1840,10 @@ class Bot(AsyncTeleBot):
         await self.set_lang(us_id, data[2])
         await self.edit_message_text(f"{await self.get_viewed_name(us_id)} {self.get_localized_string("set_lang", await self.get_lang(user.id), "confirmation")} {self.languages[data[2]]}.", call.message.chat.id, call.message.id)
 
-    async def get_lang(self, us_id : int) -> str:
+    async def get_lang(self, us_id : int, profile : UserProfile = None) -> str:
         """Returns the user language code, if not found defaults to the default language"""
-        localization = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "localization")
-        if localization: return localization
-        else: return self.default_language 
+        if profile is None: profile = await self.get_profile(us_id)
+        return profile.lang
 
     async def set_lang(self, us_id : int, lang : str):
         """Change the bot language, for the user identified by us_id"""
@@ -381,46 +1858,58 @@ class Bot(AsyncTeleBot):
         await self.set_gender(us_id, data[2])
         await self.edit_message_text(f"{await self.get_viewed_name(us_id)} {self.get_localized_string("set_gender", await self.get_lang(user.id), data[2])}", call.message.chat.id, call.message.id)
 
-    async def get_gender(self, us_id : int) -> str:
+    async def get_gender(self, us_id : int, profile : UserProfile = None) -> str:
         """Returns the user gender, if not found defaults to m(ale)"""
-        gender = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "gender")
-        if gender: return gender
-        else: return self.genders[0]
+        if profile is None: profile = await self.get_profile(us_id)
+        return profile.gender
 
     async def set_gender(self, us_id : int, gender : str):
         """Change the gender of the name chosen by randomname, for the user identified by us_id"""
         await self.db.upsert_values("users", {"gender" : gender}, self.db.query.user_id == us_id)
 
-    async def get_admin(self, us_id : int) -> bool:
+    async def get_admins(self) -> dict[int, int | None]:
+        """Returns the admins {user_id : chat_id}, read with a single pass over the users table the first time"""
+        if self.admins is None:
+            admins = {}
+            owner_status = None
+            async for user in self.db.iterate("users", ("user_id", "chat_id", "admin_status")):
+                if user.get("user_id") == self.OWNER_ID: owner_status = user.get("admin_status")
+                if user.get("admin_status") or (user.get("admin_status") == None and user.get("user_id") == self.OWNER_ID): admins[user["user_id"]] = user.get("chat_id")
+            if owner_status == None: admins.setdefault(self.OWNER_ID, None) #The owner is admin unless explicitly removed
+            self.admins = admins
+        return self.admins
+
+    async def get_admin(self, us_id : int, profile : UserProfile = None) -> bool:
         """Return true if the user identified by us_id is admin, false otherwise"""
-        admin = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "admin_status")
-        if us_id == self.OWNER_ID and admin == None: return True
-        if admin == None: return False
-        return admin
+        return us_id in await self.get_admins()
 
     async def set_admin(self, message, us_id : int):
         """Turn the user identified by us_id into an admin or vice versa"""
-        viewed_name = await self.get_viewed_name(us_id)
+        profile = await self.get_profile(us_id)
+        viewed_name = await self.get_viewed_name(us_id, profile)
         user = message.from_user
         lang = await self.get_lang(user.id)
 
-        if await self.get_admin(us_id) == True: bot_answer = f"{viewed_name} {self.get_localized_string("set_admin", lang, "remove")}"
+        is_admin = await self.get_admin(us_id)
+        if is_admin == True: bot_answer = f"{viewed_name} {self.get_localized_string("set_admin", lang, "remove")}"
         else: bot_answer = f"{viewed_name} {self.get_localized_string("set_admin", lang, "add")}"
         
-        await self.db.upsert_values("users", {"admin_status" : not await self.get_admin(us_id)}, self.db.query.user_id == us_id)
+        await self.db.upsert_values("users", {"admin_status" : not is_admin}, self.db.query.user_id == us_id, flush=True)
+        if is_admin: self.admins.pop(us_id, None)
+        else: self.admins[us_id] = await self.get_chat_id(us_id, profile)
 
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
 
-    async def get_notification_status(self, us_id : int) -> bool:
+    async def get_notification_status(self, us_id : int, profile : UserProfile = None) -> bool:
         """Returns true if the user has on/off notifications active, false otherwise"""
-        notifications = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "notifications")
-        if notifications == None: return True
-        else: return notifications
+        if profile is None: profile = await self.get_profile(us_id)
+        return profile.notifications
 
-    async def get_excl_sentence(self, us_id : int) -> str | None:
+    async def get_excl_sentence(self, us_id : int, profile : UserProfile = None) -> str | None:
         """Returns the special sentence of the user us_id"""
-        return await self.db.get_single_doc("users", self.db.query.user_id == us_id, "exclusive_sentence")
+        if profile is None: profile = await self.get_profile(us_id)
+        return profile.sentence
 
     async def set_excl_sentence(self, message, us_id : int): 
         """Set a special sentence the user identified by us_id receives when greeted by the bot"""
@@ -443,20 +1932,20 @@ class Bot(AsyncTeleBot):
 
     async def get_info(self, message, us_id : int):
         """The bot sends a message with basic user informations"""
-        user_doc = await self.db.get_single_doc("users", self.db.query.user_id == us_id)
+        profile = await self.get_profile(us_id)
         user = message.from_user
         lang = await self.get_lang(user.id)
 
-        if user_doc:
-            bot_answer = f"{self.get_localized_string("info", lang, "name")} {user_doc["first_name"]}\n{self.get_localized_string("info", lang, "last_name")} {user_doc["last_name"]}\nUsername: {user_doc["username"]}\n{self.get_localized_string("info", lang, "user_id")} {user_doc["user_id"]}\n{self.get_localized_string("info", lang, "bot_name")} {await self.get_botname(us_id)}\n{self.get_localized_string("info", lang, "sentence")} {await self.get_excl_sentence(us_id)}\n{self.get_localized_string("info", lang, "language")} {await self.get_lang(us_id)}\n{self.get_localized_string("info", lang, "gender")} {await self.get_gender(us_id)}\n{self.get_localized_string("info", lang, "notification")} {await self.get_notification_status(us_id)}\n{self.get_localized_string("info", lang, "admin")} {await self.get_admin(us_id)}"
+        if profile.found:
+            bot_answer = f"{self.get_localized_string("info", lang, "name")} {profile.first_name}\n{self.get_localized_string("info", lang, "last_name")} {profile.last_name}\nUsername: {profile.username}\n{self.get_localized_string("info", lang, "user_id")} {profile.user_id}\n{self.get_localized_string("info", lang, "bot_name")} {await self.get_botname(us_id, profile)}\n{self.get_localized_string("info", lang, "sentence")} {await self.get_excl_sentence(us_id, profile)}\n{self.get_localized_string("info", lang, "language")} {await self.get_lang(us_id, profile)}\n{self.get_localized_string("info", lang, "gender")} {await self.get_gender(us_id, profile)}\n{self.get_localized_string("info", lang, "notification")} {await self.get_notification_status(us_id, profile)}\n{self.get_localized_string("info", lang, "admin")} {await self.get_admin(us_id, profile)}"
         else: bot_answer = self.get_localized_string("choose_argument", lang, "not_found")
 
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
 
-    async def get_event(self, us_id : int):
+    async def get_event(self, us_id : int, profile : UserProfile = None):
         """Return the current pending event to handle for that user"""
-        return await self.db.get_single_doc("users", self.db.query.user_id == us_id, "event")
+        return self.pending_events.get(us_id)
 
     async def set_event(self, message, next_step : callable , content = None, command : callable = None, second_arg : bool = None):
         """Creates an event packet to handle multimessage commands"""
@@ -468,92 +1957,157 @@ class Bot(AsyncTeleBot):
             else: command_name = command
         else: command_name = None
         
-        await self.db.upsert_values("users", {"event" : {"next" : next_step, "content" : content, "command" : command_name, "second_arg" : second_arg}}, self.db.query.user_id == user.id)
+        self.pending_events.set(user.id, {"next" : next_step, "content" : content, "command" : command_name, "second_arg" : second_arg})
 
     async def send_message_to(self, message, chat_id : int, scope : str = None, acknowledge : bool = True):
         """Send a message to the chat identified by chat_id"""
         user = message.from_user
-        lang = await self.get_lang(user.id)
+        profile = await self.get_profile(user.id)
+        lang = await self.get_lang(user.id, profile)
         bot_answer = self.get_localized_string("sent", lang)
-        viewed_name = await self.get_viewed_name(user.id)
+        viewed_name = await self.get_viewed_name(user.id, profile)
 
         from_text = f"{self.get_localized_string("send_to", await self.get_lang(chat_id), "from")} {viewed_name}({user.id}):"
         if scope == 'B': from_text = f"{self.get_localized_string("broadcast", await self.get_lang(chat_id), "from")} {viewed_name}:"
         if scope == 'A': from_text = f"{self.get_localized_string("broadcast", await self.get_lang(chat_id), "admin_from")} {viewed_name}:"
 
         if message.content_type in ("text", "photo", "audio", "voice", "sticker", "document"):
-            try:
-                await self.send_message(chat_id, from_text)
-                if message.content_type == "text":
-                    await self.send_message(chat_id, message.text)
-                elif message.content_type == "photo":
-                    file_id = message.photo[-1].file_id
-                    caption = message.caption if message.caption else None
-                    await self.send_photo(chat_id, file_id, caption)
-                elif message.content_type == "audio":
-                    file_id = message.audio.file_id
-                    caption = message.caption if message.caption else None
-                    await self.send_audio(chat_id, file_id, caption)
-                elif message.content_type == "voice":
-                    file_id = message.voice.file_id
-                    caption = message.caption if message.caption else None
-                    await self.send_voice(chat_id, file_id, caption) 
-                elif message.content_type == "sticker":
-                    file_id = message.sticker.file_id
-                    await self.send_sticker(chat_id, file_id)
-                elif message.content_type == "document":
-                    file_id = message.document.file_id
-                    caption = message.caption if message.caption else None
-                    await self.send_document(chat_id, file_id, caption=caption)         
-            except telebot.apihelper.ApiTelegramException: bot_answer = self.get_localized_string("send_to", lang, "blocked")
+            try: await self.send_content(message, chat_id, from_text)
+            except telebot.asyncio_helper.ApiTelegramException: bot_answer = self.get_localized_string("send_to", lang, "blocked")
         else: bot_answer = self.get_localized_string("send_to", lang, "unsupported")
             
         if acknowledge: 
             await self.reply_to(message, bot_answer)
             await self.logging_procedure(message, bot_answer)
 
+    async def send_content(self, message, chat_id : int, from_text : str):
+        """Sends to chat_id the from_text header followed by the content of message, each request goes through the broadcaster limits"""
+        request = self.broadcaster.request
+        await request(chat_id, lambda: self.send_message(chat_id, from_text))
+        caption = message.caption if message.caption else None
+        if message.content_type == "text":
+            await request(chat_id, lambda: self.send_message(chat_id, message.text))
+        elif message.content_type == "photo":
+            await request(chat_id, lambda: self.send_photo(chat_id, message.photo[-1].file_id, caption))
+        elif message.content_type == "audio":
+            await request(chat_id, lambda: self.send_audio(chat_id, message.audio.file_id, caption))
+        elif message.content_type == "voice":
+            await request(chat_id, lambda: self.send_voice(chat_id, message.voice.file_id, caption))
+        elif message.content_type == "sticker":
+            await request(chat_id, lambda: self.send_sticker(chat_id, message.sticker.file_id))
+        elif message.content_type == "document":
+            await request(chat_id, lambda: self.send_document(chat_id, message.document.file_id, caption=caption))
+
+    def broadcast_report(self, lang : str, state : str, done : int, total : int, counts : dict[str, int]) -> str:
+        """Returns the text reporting the progress of a broadcast, state is progress or completed"""
+        return (f"{self.get_localized_string("broadcast", lang, state)} {done}/{total}\n{counts.get("sent", 0)} {self.get_localized_string("broadcast", lang, "sent")}\n"
+                f"{counts.get("blocked", 0)} {self.get_localized_string("broadcast", lang, "blocked")}\n{counts.get("failed", 0)} {self.get_localized_string("broadcast", lang, "failed")}")
+
     async def broadcast(self, message, admin_only : bool=False):
-        """Send a message to all the users of the bot, or if admin only to just the admins"""
-        acknowledge = True
-        async for user in self.db.tables["users"]:
-            try: 
-                if user["chat_id"]:
-                    if admin_only and user["admin_status"]:
-                        await self.send_message_to(message, user["chat_id"], 'A', acknowledge)
-                        acknowledge = False
-                    if not admin_only:
-                        await self.send_message_to(message, user["chat_id"], 'B', acknowledge)
-                        acknowledge = False
-            except (KeyError, telebot.apihelper.ApiTelegramException): pass
+        """Send a message to all the users of the bot, or if admin only to just the admins, reporting the progress to the sender"""
+        user = message.from_user
+        profile = await self.get_profile(user.id)
+        lang = await self.get_lang(user.id, profile)
+        if message.content_type not in ("text", "photo", "audio", "voice", "sticker", "document"):
+            bot_answer = self.get_localized_string("send_to", lang, "unsupported")
+            await self.reply_to(message, bot_answer)
+            await self.logging_procedure(message, bot_answer)
+            return
+
+        viewed_name = await self.get_viewed_name(user.id, profile)
+        recipients = await self.admin_recipients() if admin_only else await self.group_recipients(lambda doc: True)
+        chat_ids = list(recipients)
+        header = "admin_from" if admin_only else "from"
+        headers = {recipient_lang : f"{self.get_localized_string("broadcast", recipient_lang, header)} {viewed_name}:" for recipient_lang in set(recipients.values())} #Built once per language
+
+        async def send(chat_id : int):
+            await self.send_content(message, chat_id, headers[recipients[chat_id]])
+
+        report = await self.reply_to(message, self.broadcast_report(lang, "progress", 0, len(chat_ids), {}))
+        last_report = time.monotonic()
+
+        async def progress(done : int, counts : dict[str, int]):
+            nonlocal last_report
+            if time.monotonic() - last_report < self.broadcaster.progress_interval: return
+            last_report = time.monotonic()
+            try: await self.edit_message_text(self.broadcast_report(lang, "progress", done, len(chat_ids), counts), report.chat.id, report.message_id)
+            except telebot.asyncio_helper.ApiException: pass
+
+        counts = await self.broadcaster.run(chat_ids, send, progress)
+        bot_answer = self.broadcast_report(lang, "completed", len(chat_ids), len(chat_ids), counts)
+        try: await self.broadcaster.request(report.chat.id, lambda: self.edit_message_text(bot_answer, report.chat.id, report.message_id))
+        except telebot.asyncio_helper.ApiException: await self.send_message(report.chat.id, bot_answer)
+        await self.logging_procedure(message, bot_answer)
 
     async def ask_target(self, message, command : callable, second_arg : bool = True):
         """First step of the admin framework, it prompts the admin to specify the user who they're targeting with their command. The admin framework let the admins reuse the functions written for normal use in a specific admin mode"""
         user = message.from_user
-        bot_answer = self.get_localized_string("choose_target", await self.get_lang(user.id))
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("choose_target", await self.get_lang(user.id, profile))
 
-        is_admin = await self.get_admin(user.id)
+        is_admin = await self.get_admin(user.id, profile)
         if not is_admin:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
         
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, selective=True)
-        async for user_data in self.db.tables["users"]:
-            if user_data["username"]: button = types.KeyboardButton(user_data["username"])
-            else: button = types.KeyboardButton(user_data["first_name"])
-            markup.add(button)
-
+        markup = await self.target_picker()
         await self.reply_to(message, bot_answer, reply_markup=markup)
         await self.set_event(message, self.validate_target, command=command, second_arg=second_arg)
         await self.logging_procedure(message, bot_answer)
 
+    async def get_target_index(self) -> Target_Index:
+        """Returns the index of the users' names, built with a single pass over the users table the first time"""
+        if not self.target_index.ready:
+            self.target_index.build([(user_data["user_id"], user_data.get("username"), user_data.get("first_name")) async for user_data in self.db.iterate("users", ("user_id", "username", "first_name"))])
+        return self.target_index
+
+    async def target_picker(self, query : str = "", cursor : int = 0) -> types.InlineKeyboardMarkup | None:
+        """Returns an inline keyboard with a page of the users whose name starts with query, or of the closest names if none does. None if no user is found"""
+        index = await self.get_target_index()
+        users, next_cursor = index.page(query, cursor, self.picker_size)
+        if not users and query and not cursor: users = index.fuzzy(query, self.picker_size)
+        if not users: return None
+
+        markup = types.InlineKeyboardMarkup()
+        for us_id in users: markup.add(types.InlineKeyboardButton(f"{index.label(us_id)} ({us_id})", callback_data=f"target_{us_id}"))
+        previous_cursor = index.previous_cursor(query, cursor, self.picker_size)
+        query = query.encode()[:40].decode(errors="ignore") #callback data is limited to 64 bytes
+        navigation = []
+        if cursor: navigation.append(types.InlineKeyboardButton("◀", callback_data=f"targetpage_{previous_cursor}_{query}"))
+        if next_cursor is not None: navigation.append(types.InlineKeyboardButton("▶", callback_data=f"targetpage_{next_cursor}_{query}"))
+        if navigation: markup.row(*navigation)
+        return markup
+
+    async def handle_target_buttons(self, call):
+        """Callback when a button of the target picker is pressed, turns the page or selects the target of the pending admin command"""
+        user = call.from_user
+        await self.answer_callback_query(call.id)
+        data = call.data.split("_", 2)
+        event = await self.get_event(user.id)
+        if not event or event["next"] != self.validate_target.__name__: #The picker expired or the command was cancelled
+            await self.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
+            return
+
+        if data[0] == "targetpage":
+            markup = await self.target_picker(data[2], int(data[1]))
+            await self.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=markup)
+            return
+
+        self.pending_events.pop(user.id)
+        await self.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=None)
+        message = call.message
+        message.from_user = user #The admin framework expects the admin's message
+        await self.ask_argument(message, event["command"], int(data[1]), event["second_arg"])
+
     async def validate_target(self, message, command : callable, second_arg : bool = True):
         """Checks is the name is unique, it it isn't prompts the admin to specify the id"""
         admin_user = message.from_user
         lang = await self.get_lang(admin_user.id)
 
-        us_id = await self.db.get_single_doc("users", self.db.query.username == message.text, "user_id")
+        user_docs = await self.db.get_by_key("users", "username", message.text)
+        us_id = user_docs[0]["user_id"] if user_docs else None
         if not us_id:
-            user_docs = await self.db.get_docs("users", self.db.query.first_name == message.text)
+            user_docs = await self.db.get_by_key("users", "first_name", message.text)
             if len(user_docs) == 1: us_id = user_docs[0]["user_id"] #One user found, everything is fine
             elif len(user_docs) > 1: #Multiple users found, specify which one is the correct one!
                 bot_answer = f"{self.get_localized_string("choose_argument", lang, "multiple_found")}"
@@ -569,6 +2123,12 @@ class Bot(AsyncTeleBot):
                 await self.logging_procedure(message, bot_answer)
                 await self.set_event(message, self.handle_multiple_users, command=command, second_arg=second_arg)
                 return
+            elif markup := await self.target_picker(message.text or ""): #No exact match, the admin picks among the similar names
+                bot_answer = self.get_localized_string("choose_argument", lang, "search_results")
+                await self.reply_to(message, bot_answer, reply_markup=markup)
+                await self.logging_procedure(message, bot_answer)
+                await self.set_event(message, self.validate_target, command=command, second_arg=second_arg)
+                return
             else: #No users found
                 bot_answer = self.get_localized_string("choose_argument", lang, "not_found")
                 await self.reply_to(message, bot_answer, reply_markup=types.ReplyKeyboardRemove())
@@ -582,7 +2142,7 @@ class Bot(AsyncTeleBot):
         admin_user = message.from_user
         lang = await self.get_lang(admin_user.id)
 
-        us_id = await self.db.get_single_doc("users", self.db.query.user_id == int(message.text), "user_id")
+        us_id = await self.db.get_cached_doc("users", int(message.text), "user_id")
         if not us_id:
             bot_answer = self.get_localized_string("choose_argument", lang, "not_found")
             await self.reply_to(message, bot_answer, reply_markup=types.ReplyKeyboardRemove())
@@ -607,8 +2167,8 @@ class Bot(AsyncTeleBot):
         
         if command == self.set_permission.__name__:
             markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, selective=True)
-            commands = await self.db.get_single_doc("users", self.db.query.user_id == us_id, "commands")
-            if commands:
+            commands = await self.get_permission(us_id)
+            if isinstance(commands, dict):
                 for command_name in commands:
                     button = types.KeyboardButton(command_name)
                     markup.add(button)
@@ -623,6 +2183,42 @@ class Bot(AsyncTeleBot):
         if banned_list == None: banned_list = []
         return banned_list
 
+    async def get_meta(self, meta_type : str, attribute : str):
+        """Returns an attribute of the bookkeeping document of meta_type, moving the document to the meta table if it's still in banned_words"""
+        doc = await self.db.get_single_doc("meta", self.db.query.type == meta_type)
+        if doc is None:
+            doc = await self.db.get_single_doc("banned_words", self.db.query.type == meta_type) #stored there by the older versions
+            if doc is None: return None
+            await self.set_meta(meta_type, {key : value for key, value in doc.items() if key != "type"})
+            await self.db.remove_values("banned_words", self.db.query.type == meta_type, flush=True)
+        return doc.get(attribute)
+
+    async def set_meta(self, meta_type : str, data : dict):
+        """Stores data in the bookkeeping document of meta_type"""
+        await self.db.upsert_values("meta", {"type" : meta_type, **data}, self.db.query.type == meta_type, flush=True)
+
+    async def get_banned_version(self) -> int:
+        """Returns the current version of the banned lists"""
+        if self.banned_version is None: self.banned_version = await self.get_meta("version", "version") or 0
+        return self.banned_version
+
+    async def update_banned_version(self):
+        """Increases the banned lists version after a change, drops the compiled matcher and starts the sweep of the botnames"""
+        self.banned_version = await self.get_banned_version() + 1
+        await self.set_meta("version", {"version" : self.banned_version})
+        self.banned_matcher = None
+        if self.sweep_task: self.sweep_task.cancel()
+        self.sweep_task = asyncio.create_task(self.revalidate_botnames())
+
+    async def revalidate_botnames(self):
+        """Checks once every botname validated against an older version of the banned lists, resetting the banned ones"""
+        version = await self.get_banned_version()
+        to_check = [(user["user_id"], user["bot_name"]) async for user in self.db.iterate("users") if user.get("bot_name") and user.get("bot_name_version") != version]
+        for us_id, botname in to_check:
+            await self.store_botname_check(us_id, botname, await self.check_banned_name(botname), version)
+            await asyncio.sleep(0) #let the handlers run between the writes
+        if self.LOG: self.logger.info(f"Botnames revalidated against banned lists version {version}: {len(to_check)} checked")
+
     async def add_banned_words(self, message, word_type : str):
         """Add a word to the banned words list"""
         word = (message.text).lower()
@@ -638,7 +2234,8 @@ class Bot(AsyncTeleBot):
         
         banned_list.append(word)
         list_data = {"list":banned_list, "type" : word_type}
-        await self.db.upsert_values("banned_words", list_data, self.db.query.type == word_type)
+        await self.db.upsert_values("banned_words", list_data, self.db.query.type == word_type, flush=True)
+        await self.update_banned_version()
 
         bot_answer = f"{word} {self.get_localized_string("banned_words", lang, "banned")}"
         await self.reply_to(message, bot_answer)
@@ -655,7 +2252,8 @@ class Bot(AsyncTeleBot):
             banned_list.remove(word)
             bot_answer = f"{word} {self.get_localized_string("banned_words", lang, "unbanned")}"
             list_data = {"list":banned_list, "type" : word_type}
-            await self.db.upsert_values("banned_words", list_data, self.db.query.type == word_type)
+            await self.db.upsert_values("banned_words", list_data, self.db.query.type == word_type, flush=True)
+            await self.update_banned_version()
 
             await self.reply_to(message, bot_answer)
             await self.logging_procedure(message, bot_answer)
@@ -665,12 +2263,15 @@ class Bot(AsyncTeleBot):
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
 
+    async def get_custom_commands(self) -> dict[str, dict]:
+        """Returns the dynamically created commands {name : content}, read from the database only the first time"""
+        if self.custom_commands is None:
+            self.custom_commands = {command["name"] : command["content"] async for command in self.db.iterate("custom_commands")}
+        return self.custom_commands
+
     async def get_custom_commands_names(self) -> list[str]:
         """Returns a list of the dynamically created commands"""
-        commands = []
-        async for command in self.db.tables["custom_commands"]:
-            commands.append(command["name"])
-        return commands
+        return list(await self.get_custom_commands())
 
     async def ask_custom_command_content(self, message):
         """Asks the content needed to create the commands"""
@@ -685,6 +2286,7 @@ class Bot(AsyncTeleBot):
     async def add_custom_command(self, message, name : str):
         """Adds a custom command to the database"""
         user = message.from_user
+        profile = await self.get_profile(user.id)
         if message.content_type == "photo": file_id = message.photo[-1].file_id
         elif message.content_type == "audio": file_id = message.audio.file_id
         elif message.content_type == "voice": file_id = message.voice.file_id
@@ -692,63 +2294,111 @@ class Bot(AsyncTeleBot):
         elif message.content_type == "document": file_id = message.document.file_id
         elif message.content_type == "text": file_id = None
         else: 
-            await self.reply_to(message, self.get_localized_string("send_to", await self.get_lang(user.id), "unsupported"))
+            await self.reply_to(message, self.get_localized_string("send_to", await self.get_lang(user.id, profile), "unsupported"))
             return
 
         command_data = {"content" : {"type" : message.content_type, "text" : message.text, "file_id" : file_id, "caption" : message.caption}, "name" : name.lower()}
-        await self.db.upsert_values("custom_commands", command_data, self.db.query.name == name.lower())
+        await self.db.upsert_values("custom_commands", command_data, self.db.query.name == name.lower(), flush=True)
+        (await self.get_custom_commands())[name.lower()] = command_data["content"]
 
-        bot_answer = f"{name} {self.get_localized_string("custom_commands", await self.get_lang(user.id), "added")}"
+        bot_answer = f"{name} {self.get_localized_string("custom_commands", await self.get_lang(user.id, profile), "added")}"
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
 
     async def remove_custom_command(self, message):
         """Removes a custom command from the database"""
         user = message.from_user
+        profile = await self.get_profile(user.id)
         markup = types.ReplyKeyboardRemove()
 
-        if not(message.text in await self.get_custom_commands_names()):
-            bot_answer = f"{self.get_localized_string("custom_commands", await self.get_lang(user.id), "not_found")}"
+        name = (message.text or "").lower()
+        if not(name in await self.get_custom_commands()):
+            bot_answer = f"{self.get_localized_string("custom_commands", await self.get_lang(user.id, profile), "not_found")}"
             await self.reply_to(message, bot_answer, reply_markup=markup)
             await self.logging_procedure(message, bot_answer)
             return
 
-        await self.db.remove_values("custom_commands", self.db.query.name == message.text.lower())
+        await self.db.remove_values("custom_commands", self.db.query.name == name, flush=True)
+        self.custom_commands.pop(name, None)
 
-        bot_answer = f"{message.text} {self.get_localized_string("custom_commands", await self.get_lang(user.id), "removed")}"
+        bot_answer = f"{message.text} {self.get_localized_string("custom_commands", await self.get_lang(user.id, profile), "removed")}"
         await self.reply_to(message, bot_answer, reply_markup=markup)
         await self.logging_procedure(message, bot_answer)
 
-    def generate_wikipedia_event(self, lang : str):
-        """Generate a string containing an event that happened on this day."""
+    def fetch_wikipedia_events(self, day : date) -> list[str]:
+        """Downloads and parses the events of the "day" page from Italian Wikipedia, blocking"""
+        wikipedia = features.load("wikipedia")
         wikipedia.set_lang("it")
         engToIta = {"January": "gennaio", "February" : "febbraio", "March" : "marzo", "April" : "aprile", "May" : "maggio", "June" : "giugno",
                     "July" : "luglio", "August" : "agosto", "September" : "settembre", "October" : "ottobre" , "November" : "novembre", "December" : "dicembre"}
-        month = engToIta[date.today().strftime("%B")] 
-        page_title = f"{date.today().day}_{month}"
+        month = engToIta[day.strftime("%B")] 
+        page_title = f"{day.day}_{month}"
         section_name = "Eventi"
-        try:
-            page = wikipedia.page(page_title)
-            content = page.section(section_name)
-            events_list = [line for line in content.split("\n")]
-            event = random.choice(events_list)
-            if lang != "it":
-                translator = GoogleTranslator("it", lang)
-                event = translator.translate(event)
-            bot_answer = f"{event}"
-        except wikipedia.exceptions.PageError:
-            bot_answer = self.get_localized_string("wikipedia", lang, "page404")
-        return bot_answer
+        page = wikipedia.page(page_title)
+        content = page.section(section_name) or ""
+        return [line for line in content.split("\n") if line.strip()]
+
+    async def refresh_wikipedia_events(self):
+        """Updates the cached events if they aren't of today, on failure the previous events are kept"""
+        async with self.events_lock:
+            today = date.today()
+            if self.events_date == today: return
+            try: events = await asyncio.get_running_loop().run_in_executor(None, self.fetch_wikipedia_events, today)
+            except Exception as e: 
+                self.logger.warning(f"Wikipedia events refresh failed, serving the events of {self.events_date}: {e}")
+                return
+            if events: 
+                self.wikipedia_events, self.events_date = events, today
+                if self.translation_task: self.translation_task.cancel()
+                self.start_pretranslation()
+
+    def start_pretranslation(self):
+        """Starts translating the current events in background, unless it's already running, the translator is missing or it failed less than translation_backoff seconds ago"""
+        if not self.translate_events or time.monotonic() < self.translation_retry_at: return
+        if self.translation_task and not self.translation_task.done(): return
+        self.translation_task = asyncio.create_task(self.pretranslate_events(self.wikipedia_events))
+
+    async def pretranslate_events(self, events : list[str]):
+        """Translates the events in background in every bot language, so the users don't wait for the translator"""
+        for lang in self.languages:
+            try: await self.translations.translate(events, lang)
+            except Exception as e: 
+                self.logger.warning(f"Translation of the events in {lang} failed, retrying in {self.translation_backoff}s: {e}")
+                self.translation_retry_at = time.monotonic() + self.translation_backoff
+                break
+        await self.translations.flush()
+
+    async def refresh_events_daily(self, retry_interval : float = 300):
+        """Pre-warms the events cache and refreshes it at every local midnight, retrying every retry_interval seconds after a failure"""
+        while True:
+            await self.refresh_wikipedia_events()
+            await self.translations.flush() #the translations of the single events are written here, on shutdown and after each pretranslation
+            midnight = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+            wait = (midnight - datetime.now()).total_seconds()
+            if self.events_date != date.today(): wait = min(wait, retry_interval)
+            await asyncio.sleep(max(wait, 1))
+
+    async def generate_wikipedia_event(self, lang : str) -> str:
+        """Generate a string containing an event that happened on this day."""
+        if not self.wikipedia_events: await self.refresh_wikipedia_events() #only a cold cache is filled inline, stale events are served until refresh_events_daily replaces them
+        if not self.wikipedia_events: return self.get_localized_string("wikipedia", lang, "page404")
+        event = random.choice(self.wikipedia_events)
+        translation = self.translations.get(event, lang)
+        if translation is None: #Not translated yet, the Italian event is sent while the translation continues in background
+            self.start_pretranslation()
+            translation = event
+        return f"{translation}"
 
     #commands
     async def send_greets(self, message):
         """Greet the user with its name and a special sentence"""
         user = message.from_user
-        lang = await self.get_lang(user.id)
-        await self.store_user_data(user, message.chat.id) #Create or update the user's table when starting
-        viewed_name = await self.get_viewed_name(user.id)
+        profile = await self.store_user_data(user, message.chat.id) #Create or update the user's table when starting
+        lang = await self.get_lang(user.id, profile)
+        viewed_name = await self.get_viewed_name(user.id, profile)
 
-        if await self.get_excl_sentence(user.id): special_reply = f"\n{await self.get_excl_sentence(user.id)}"
+        sentence = await self.get_excl_sentence(user.id, profile)
+        if sentence: special_reply = f"\n{sentence}"
         else: special_reply = ""
         
         bot_answer = f"{self.get_localized_string("greet", lang)} {viewed_name}!{special_reply}"
@@ -758,16 +2408,17 @@ class Bot(AsyncTeleBot):
     
     async def set_user_lang(self, message, us_id : int=None):
         user = message.from_user
+        profile = await self.get_profile(user.id)
         if not us_id: us_id = user.id
-        bot_answer = self.get_localized_string("set_lang",await self.get_lang(user.id), "choice")
+        bot_answer = self.get_localized_string("set_lang",await self.get_lang(user.id, profile), "choice")
         markup = types.InlineKeyboardMarkup()
         for lang, label in self.languages.items():
             button = types.InlineKeyboardButton(label, callback_data="lang_"+str(us_id)+"_"+lang)
             markup.add(button)
 
-        has_permission = await self.get_permission(user.id, "lang")
+        has_permission = await self.get_permission(user.id, "lang", profile)
         if has_permission != True:
-            await self.permission_denied_procedure(message, has_permission)
+            await self.permission_denied_procedure(message, has_permission, profile)
             return
         
         await self.reply_to(message, bot_answer, reply_markup=markup)
@@ -776,11 +2427,12 @@ class Bot(AsyncTeleBot):
     async def set_name(self, message):
         """Start the event chain to set the user's botname"""
         user = message.from_user
-        bot_answer = self.get_localized_string("set_name", await self.get_lang(user.id), "prompt")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("set_name", await self.get_lang(user.id, profile), "prompt")
 
-        has_permission = await self.get_permission(user.id, "setname")
+        has_permission = await self.get_permission(user.id, "setname", profile)
         if has_permission != True:
-            await self.permission_denied_procedure(message, has_permission)
+            await self.permission_denied_procedure(message, has_permission, profile)
             return
         
         await self.reply_to(message, bot_answer)
@@ -800,12 +2452,13 @@ class Bot(AsyncTeleBot):
     async def send_to_owner(self, message):
         """Send a message to the owner of the bot"""
         user = message.from_user
+        profile = await self.get_profile(user.id)
         owner_name = await self.get_viewed_name(self.OWNER_ID)
-        bot_answer = f"{self.get_localized_string("send_to", await self.get_lang(user.id), "user")} {owner_name}?"
+        bot_answer = f"{self.get_localized_string("send_to", await self.get_lang(user.id, profile), "user")} {owner_name}?"
 
-        has_permission = await self.get_permission(user.id, "sendtoowner")
+        has_permission = await self.get_permission(user.id, "sendtoowner", profile)
         if has_permission != True:
-            await self.permission_denied_procedure(message, has_permission)
+            await self.permission_denied_procedure(message, has_permission, profile)
             return
         
         await self.reply_to(message, bot_answer)
@@ -815,11 +2468,12 @@ class Bot(AsyncTeleBot):
     async def send_to_admin(self, message):
         """Send a message to all the admins of the bot"""
         user = message.from_user
-        bot_answer = self.get_localized_string("send_to", await self.get_lang(user.id), "admins")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("send_to", await self.get_lang(user.id, profile), "admins")
 
-        has_permission = await self.get_permission(user.id, "sendtoadmin")
+        has_permission = await self.get_permission(user.id, "sendtoadmin", profile)
         if has_permission != True:
-            await self.permission_denied_procedure(message, has_permission)
+            await self.permission_denied_procedure(message, has_permission, profile)
             return
         
         await self.reply_to(message, bot_answer)
@@ -830,24 +2484,24 @@ class Bot(AsyncTeleBot):
         """send a random event of the day from italian wikipedia (traslated with google when the language differs)"""
         user = message.from_user
         lang = await self.get_lang(user.id)
-        loop = asyncio.get_running_loop()
-        bot_answer = await loop.run_in_executor(None, self.generate_wikipedia_event, lang)
+        bot_answer = await self.generate_wikipedia_event(lang)
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
     
     async def set_user_gender(self, message, us_id : int=None):
         """Call function to set the user's gender"""
         user = message.from_user
+        profile = await self.get_profile(user.id)
         if not us_id: us_id = user.id
-        bot_answer = self.get_localized_string("set_gender",await self.get_lang(user.id), "choice")
+        bot_answer = self.get_localized_string("set_gender",await self.get_lang(user.id, profile), "choice")
         markup = types.InlineKeyboardMarkup()
         for gender in self.genders:
-            button = types.InlineKeyboardButton(self.get_localized_string("set_gender",await self.get_lang(user.id), gender+"_label"), callback_data="gender_"+str(us_id)+"_"+gender)
+            button = types.InlineKeyboardButton(self.get_localized_string("set_gender",await self.get_lang(user.id, profile), gender+"_label"), callback_data="gender_"+str(us_id)+"_"+gender)
             markup.add(button)
 
-        has_permission = await self.get_permission(user.id, "gender")
+        has_permission = await self.get_permission(user.id, "gender", profile)
         if has_permission != True:
-            await self.permission_denied_procedure(message, has_permission)
+            await self.permission_denied_procedure(message, has_permission, profile)
             return
         
         await self.reply_to(message, bot_answer, reply_markup=markup)
@@ -859,6 +2513,12 @@ class Bot(AsyncTeleBot):
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
     
+    async def feature_unavailable(self, message):
+        """Replies to the commands disabled because their optional dependencies aren't installed"""
+        bot_answer = self.get_localized_string("unavailable", await self.get_lang(message.from_user.id))
+        await self.reply_to(message, bot_answer)
+        await self.logging_procedure(message, bot_answer)
+
     async def random_name(self, message):
         """Set the user a random name, also doable by using -r as argument for setname"""
         user = message.from_user
@@ -872,13 +2532,14 @@ class Bot(AsyncTeleBot):
     async def request_qrcode(self, message):
         """Allows the user to generate a qr code containing text"""
         user = message.from_user
-        chat_id = await self.get_chat_id(user.id)
-        has_permission = await self.get_permission(user.id, "qrcode")
+        profile = await self.get_profile(user.id)
+        chat_id = await self.get_chat_id(user.id, profile)
+        has_permission = await self.get_permission(user.id, "qrcode", profile)
         if has_permission != True:
-            await self.permission_denied_procedure(message, has_permission)
+            await self.permission_denied_procedure(message, has_permission, profile)
             return
         
-        bot_answer = self.get_localized_string("qrcode", await self.get_lang(user.id), "msg_to_send")
+        bot_answer = self.get_localized_string("qrcode", await self.get_lang(user.id, profile), "msg_to_send")
         await self.reply_to(message, bot_answer)
         await self.set_event(message, self.generate_qrcode, content=chat_id)
         await self.logging_procedure(message, bot_answer)
@@ -886,16 +2547,17 @@ class Bot(AsyncTeleBot):
     async def set_notifications(self, message):
         """Allows the user to enable/disable the status notifications"""
         user = message.from_user
-        lang = await self.get_lang(user.id)
+        profile = await self.get_profile(user.id)
+        lang = await self.get_lang(user.id, profile)
         
-        if not await self.db.contains("users", self.db.query.user_id == user.id):
-            await self.permission_denied_procedure(message, "not_found")
+        if not profile.found:
+            await self.permission_denied_procedure(message, "not_found", profile)
             return
 
-        if await self.get_notification_status(user.id): bot_answer = self.get_localized_string("notifications", lang, "off")
+        if await self.get_notification_status(user.id, profile): bot_answer = self.get_localized_string("notifications", lang, "off")
         else: bot_answer = self.get_localized_string("notifications", lang, "on")
 
-        await self.db.upsert_values("users", {"notifications" : not await self.get_notification_status(user.id)}, self.db.query.user_id == user.id)
+        await self.db.upsert_values("users", {"notifications" : not await self.get_notification_status(user.id, profile)}, self.db.query.user_id == user.id)
         await self.reply_to(message, bot_answer)
 
         await self.logging_procedure(message, bot_answer)
@@ -913,7 +2575,7 @@ class Bot(AsyncTeleBot):
         """Delete any pending event"""
         user = message.from_user
         markup = types.ReplyKeyboardRemove()
-        await self.db.upsert_values("users", {"event" : None}, self.db.query.user_id == user.id)
+        self.pending_events.pop(user.id)
 
         if reply:
             bot_answer = self.get_localized_string("cancel", await self.get_lang(user.id))
@@ -1008,20 +2670,21 @@ class Bot(AsyncTeleBot):
     async def get_ids(self, message):
         """Returns a list with all the bot users"""
         user = message.from_user
-        bot_answer = ""
 
         is_admin = await self.get_admin(user.id)
         if not is_admin:
             await self.permission_denied_procedure(message, "admin_only")
             return
-        
-        async for user in self.db.tables["users"]:
-            try: 
-                if user["user_id"]: bot_answer += f"\n\n{user["user_id"]}: {user["first_name"]} {user["last_name"]}\nBotname: {await self.get_botname(user["user_id"])}"
-            except KeyError: pass
 
-        await self.reply_to(message, bot_answer)
-        await self.logging_procedure(message, bot_answer.lstrip())
+        async def entries():
+            version = await self.get_banned_version()
+            async for user in self.db.iterate("users", ("user_id", "first_name", "last_name", "bot_name", "bot_name_version")):
+                if not user.get("user_id"): continue
+                botname = user.get("bot_name")
+                if botname and user.get("bot_name_version") != version and await self.check_banned_name(botname): botname = None #Not validated yet, the sweep will update it
+                yield f"{user["user_id"]}: {user.get("first_name")} {user.get("last_name")}\nBotname: {botname}"
+
+        await self.send_report(message, "", entries(), "\n\n")
     
     async def send_to_target(self, message):
         """Allows an admin to send messages to a specific user"""
@@ -1036,12 +2699,13 @@ class Bot(AsyncTeleBot):
     async def send_in_broadcast(self, message):
         """Event chain to send a message in broadcast"""
         user = message.from_user
-        bot_answer = self.get_localized_string("broadcast", await self.get_lang(user.id), "msg_to_send")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("broadcast", await self.get_lang(user.id, profile), "msg_to_send")
 
-        is_admin = await self.get_admin(user.id)
-        has_permission = await self.get_permission(user.id, "broadcast")
+        is_admin = await self.get_admin(user.id, profile)
+        has_permission = await self.get_permission(user.id, "broadcast", profile)
         if not is_admin or not has_permission:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
         
         await self.reply_to(message, bot_answer)
@@ -1051,12 +2715,13 @@ class Bot(AsyncTeleBot):
     #Commands to add/remove words to/from the banned list    
     async def add_banned(self, message):
         user = message.from_user
-        bot_answer = self.get_localized_string("banned_words", await self.get_lang(user.id), "add_banned")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("banned_words", await self.get_lang(user.id, profile), "add_banned")
 
-        is_admin = await self.get_admin(user.id)
-        has_permission = await self.get_permission(user.id, "addbanned")
+        is_admin = await self.get_admin(user.id, profile)
+        has_permission = await self.get_permission(user.id, "addbanned", profile)
         if not is_admin or not has_permission:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
         
         await self.reply_to(message, bot_answer)
@@ -1065,12 +2730,13 @@ class Bot(AsyncTeleBot):
     
     async def remove_banned(self, message):
         user = message.from_user
-        bot_answer = self.get_localized_string("banned_words", await self.get_lang(user.id), "remove_banned")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("banned_words", await self.get_lang(user.id, profile), "remove_banned")
 
-        is_admin = await self.get_admin(user.id)
-        has_permission = await self.get_permission(user.id, "removebanned")
+        is_admin = await self.get_admin(user.id, profile)
+        has_permission = await self.get_permission(user.id, "removebanned", profile)
         if not is_admin or not has_permission:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
         
         await self.reply_to(message, bot_answer)
@@ -1079,12 +2745,13 @@ class Bot(AsyncTeleBot):
     
     async def add_ultra_banned(self, message):
         user = message.from_user
-        bot_answer = self.get_localized_string("banned_words", await self.get_lang(user.id), "add_ultrabanned")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("banned_words", await self.get_lang(user.id, profile), "add_ultrabanned")
 
-        is_admin = await self.get_admin(user.id)
-        has_permission = await self.get_permission(user.id, "addbanned")
+        is_admin = await self.get_admin(user.id, profile)
+        has_permission = await self.get_permission(user.id, "addbanned", profile)
         if not is_admin or not has_permission:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
         
         await self.reply_to(message, bot_answer)
@@ -1093,12 +2760,13 @@ class Bot(AsyncTeleBot):
     
     async def remove_ultra_banned(self, message):
         user = message.from_user
-        bot_answer = self.get_localized_string("banned_words", await self.get_lang(user.id), "remove_banned")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("banned_words", await self.get_lang(user.id, profile), "remove_banned")
 
-        is_admin = await self.get_admin(user.id)
-        has_permission = await self.get_permission(user.id, "removebanned")
+        is_admin = await self.get_admin(user.id, profile)
+        has_permission = await self.get_permission(user.id, "removebanned", profile)
         if not is_admin or not has_permission:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
         
         await self.reply_to(message, bot_answer)
@@ -1109,28 +2777,26 @@ class Bot(AsyncTeleBot):
     async def get_command_list(self, message):
         """Get a list of currently existing custom commands"""
         user = message.from_user
-        is_admin = await self.get_admin(user.id)
+        profile = await self.get_profile(user.id)
+        is_admin = await self.get_admin(user.id, profile)
 
         if not is_admin:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
 
-        bot_answer = self.get_localized_string("custom_commands", await self.get_lang(user.id), "list")
-        for command in await self.get_custom_commands_names():
-            bot_answer += (f"\n{command}")
-
-        await self.reply_to(message, bot_answer)
-        await self.logging_procedure(message, bot_answer)
+        header = self.get_localized_string("custom_commands", await self.get_lang(user.id, profile), "list")
+        await self.send_report(message, header, await self.get_custom_commands_names())
     
     async def add_command(self, message):
         """Adds an admin custom command"""
         user = message.from_user
-        bot_answer = self.get_localized_string("custom_commands", await self.get_lang(user.id), "add_command")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("custom_commands", await self.get_lang(user.id, profile), "add_command")
 
-        is_admin = await self.get_admin(user.id)
-        has_permission = await self.get_permission(user.id, "addcommand")
+        is_admin = await self.get_admin(user.id, profile)
+        has_permission = await self.get_permission(user.id, "addcommand", profile)
         if not is_admin or not has_permission:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
         
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, selective=True)
@@ -1145,12 +2811,13 @@ class Bot(AsyncTeleBot):
     async def remove_command(self, message):
         """Removes a admin defined command"""
         user = message.from_user
-        bot_answer = self.get_localized_string("custom_commands", await self.get_lang(user.id), "remove_command")
+        profile = await self.get_profile(user.id)
+        bot_answer = self.get_localized_string("custom_commands", await self.get_lang(user.id, profile), "remove_command")
 
-        is_admin = await self.get_admin(user.id)
-        has_permission = await self.get_permission(user.id, "addcommand")
+        is_admin = await self.get_admin(user.id, profile)
+        has_permission = await self.get_permission(user.id, "addcommand", profile)
         if not is_admin or not has_permission:
-            await self.permission_denied_procedure(message, "admin_only")
+            await self.permission_denied_procedure(message, "admin_only", profile)
             return
         
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, selective=True)
@@ -1165,21 +2832,22 @@ class Bot(AsyncTeleBot):
     async def handle_custom_commands(self, message):
         """Handle dynamically generated commands"""
         user = message.from_user
+        profile = await self.get_profile(user.id)
         command = message.text[1:]
-        if command in await self.get_custom_commands_names():
-            has_permission = await self.get_permission(user.id, command)
+        message_data = (await self.get_custom_commands()).get(command)
+        if message_data is not None:
+            has_permission = await self.get_permission(user.id, command, profile)
             if not has_permission:
-                await self.permission_denied_procedure(message, has_permission)
+                await self.permission_denied_procedure(message, has_permission, profile)
                 return
             
-            message_data = await self.db.get_single_doc("custom_commands", self.db.query.name == command, "content")
             if message_data["type"] == "text": await self.send_message(message.chat.id, message_data["text"])
             elif message_data["type"] == "photo": await self.send_photo(message.chat.id, message_data["file_id"], message_data["caption"])
             elif message_data["type"] == "audio": await self.send_audio(message.chat.id, message_data["file_id"], message_data["caption"])
             elif message_data["type"] == "voice": await self.send_voice(message.chat.id, message_data["file_id"], message_data["caption"])
             elif message_data["type"] == "sticker": await self.send_sticker(message.chat.id, message_data["file_id"])
             elif message_data["type"] == "document": await self.send_document(message.chat.id, message_data["file_id"], caption=message_data["caption"])
-            else: await self.reply_to(message, self.get_localized_string("send_to", self.get_lang(user.id), "unsupported"))
+            else: await self.reply_to(message, self.get_localized_string("send_to", await self.get_lang(user.id, profile), "unsupported"))
 
             if message_data["type"] == "text": content = message_data["text"]
             else: content = message_data["type"]
@@ -1190,9 +2858,9 @@ class Bot(AsyncTeleBot):
     async def handle_events(self, message):
         """Handle functions waiting for inputs or that need to be called automatically"""
         user = message.from_user
-        await self.store_user_data(user, message.chat.id)
+        profile = await self.store_user_data(user, message.chat.id)
 
-        event = await self.get_event(user.id)
+        event = await self.get_event(user.id, profile)
 
         if event:
             await self.cancel_command(message, False)
@@ -1209,10 +2877,12 @@ class Bot(AsyncTeleBot):
     async def handle_media(self,message):
         """Handles media sent from the user"""
         user = message.from_user
-        lang = await self.get_lang(user.id)
+        profile = await self.get_profile(user.id)
+        lang = await self.get_lang(user.id, profile)
+        viewed_name = await self.get_viewed_name(user.id, profile)
 
-        bot_answer = f"{self.get_localized_string("greet", lang)} {await self.get_viewed_name(user.id)}, {self.get_localized_string("handle_media", lang, "image")}"
-        if (message.voice or message.audio): bot_answer = f"{self.get_localized_string("greet", lang)} {await self.get_viewed_name(user.id)}, {self.get_localized_string("handle_media", lang, "audio")}"
+        bot_answer = f"{self.get_localized_string("greet", lang)} {viewed_name}, {self.get_localized_string("handle_media", lang, "image")}"
+        if (message.voice or message.audio): bot_answer = f"{self.get_localized_string("greet", lang)} {viewed_name}, {self.get_localized_string("handle_media", lang, "audio")}"
 
         await self.reply_to(message, bot_answer)
         await self.logging_procedure(message, bot_answer)
@@ -1230,13 +2900,20 @@ class Bot(AsyncTeleBot):
             else: content = message.content_type
 
             self.logger.info(f"{user.id}, {user_info}: {content}")
-            async with aiofiles.open(f"{self.log_path}/{user.id}.txt", "a") as log_file:
-                await log_file.write(f"{user.id}, {user_info}: {content}\n")
+            await self.log_writer.write(user.id, {"ts" : time.time(), "user_id" : user.id, "direction" : "in", "type" : message.content_type, "text" : message.text if message.content_type == "text" else message.caption, "name" : user_info})
 
     async def main(self):
-        await self.set_my_commands(self.commands["en"]) #default commands list
+        await self.set_my_commands([command for command in self.commands["en"] if command.command not in self.disabled_commands]) #default commands list
         for code, commands_list in self.commands.items():
-            await self.set_my_commands(commands_list, language_code=code)
+            await self.set_my_commands([command for command in commands_list if command.command not in self.disabled_commands], language_code=code)
+        if features.available("qrcode"): self.start_qr_pool()
+        await self.db.open()
+        await self.pending_events.open()
+        await self.get_custom_commands()
+        await self.migrate_permissions()
+        await self.get_admins()
+        await self.translations.load()
+        if features.available("wikipedia"): self.events_task = asyncio.create_task(self.refresh_events_daily())
 
         await self.send_on_off_notification("online")
 
@@ -1244,17 +2921,32 @@ class Bot(AsyncTeleBot):
 
         await self.send_on_off_notification("offline")
 
+        if self.sweep_task: self.sweep_task.cancel()
+        if self.events_task: self.events_task.cancel()
+        if self.translation_task: self.translation_task.cancel()
+        if self.qr_pool: self.qr_pool.shutdown(cancel_futures=True)
+        await self.translations.flush()
+        if self.LOG: 
+            self.logger.info(f"Users cache: {self.db.cache_stats()}")
+            self.logger.info(f"QR code cache: {self.qr_cache.stats()}")
+        await self.pending_events.close()
+        await self.log_writer.close()
+        if self.log_writer.dropped: self.logger.warning(f"Log lines dropped because the queue was full: {self.log_writer.dropped}")
         await self.db.close()
         await self.close_session()
 
 if __name__ == "__main__":
+    if "--importtime" in sys.argv: #prints how long the startup and every optional dependency take to import
+        print(features.import_report())
+        sys.exit()
     load_dotenv()
 
     DEV_MODE = False #switches on/off the online/offline notification if testing on a database with multiple users is needed
     LOG = False #switches on/off the logging of messages received by the bot
+    WRITE_BEHIND = True #switches on/off the coalescing of database writes, flushed periodically and on shutdown
 
     BOT_TOKEN = os.environ.get("BOT_TOKEN")
     OWNER_ID = int(os.environ.get("OWNER_ID"))
 
-    bot = Bot(BOT_TOKEN, OWNER_ID, "BOT_DB.JSON", log=LOG, dev_mode=DEV_MODE)
+    bot = Bot(BOT_TOKEN, OWNER_ID, "BOT_DB.JSON", log=LOG, dev_mode=DEV_MODE, write_behind=WRITE_BEHIND)
     asyncio.run(bot.main())
\ No newline at end of file